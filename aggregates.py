@@ -0,0 +1,109 @@
+# aggregates.py
+import threading
+from collections import Counter
+
+from metrics import timed
+from storage import one_write_apart
+
+
+def _num(val):
+    # Same rules as the app: blanks don't count, junk counts as 0.0
+    if val is None or val == "":
+        return None
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class EntryStats:
+    """Running totals for the sidebar card.
+
+    Saves and deletes are applied as deltas, so reading the numbers is O(1)
+    however long the history is. ``version`` is the store version the totals
+    match; when the data file moves on without us (another process, a manual
+    edit) the totals are rebuilt from scratch.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.total_entries = 0
+        self.sleep_sum = 0.0
+        self.sleep_count = 0
+        self.water_sum = 0.0
+        self.water_count = 0
+        self.mood_counts = Counter()
+
+    def rebuild(self, rows, version):
+        self.__init__()
+        for r in rows:
+            if r:
+                self._add(r, 1)
+        self.version = version
+
+    def _add(self, row, sign):
+        self.total_entries += sign
+        sleep = _num(row[1]) if len(row) > 1 else None
+        water = _num(row[3]) if len(row) > 3 else None
+        if sleep is not None:
+            self.sleep_sum += sign * sleep
+            self.sleep_count += sign
+        if water is not None:
+            self.water_sum += sign * water
+            self.water_count += sign
+        if len(row) > 2:
+            self.mood_counts[row[2]] += sign
+
+    def apply(self, old, new):
+        """Swap ``old`` for ``new`` (either may be None) in the totals."""
+        if old is not None:
+            self._add(old, -1)
+        if new is not None:
+            self._add(new, 1)
+
+    def summary(self):
+        return {
+            "total_entries": self.total_entries,
+            "avg_sleep": self.sleep_sum / self.sleep_count if self.sleep_count else None,
+            "avg_water": self.water_sum / self.water_count if self.water_count else None,
+            "mood_counts": dict(self.mood_counts),
+        }
+
+
+_stats = {}
+_lock = threading.Lock()
+
+
+@timed("aggregates.stats_for")
+def stats_for(store):
+    """The up-to-date EntryStats for ``store``, rebuilding only if out of sync."""
+    with _lock:
+        stats = _stats.setdefault(store.cache_key, EntryStats())
+        version = store.version()
+        if stats.version is None or stats.version != version:
+            stats.rebuild(store.read_all(), version)
+        return stats
+
+
+def record_change(store, version_before, old, new):
+    """Apply one save/delete made on ``store`` as a delta.
+
+    ``version_before`` is ``store.version()`` taken before the write; if the
+    totals weren't at that version, or another save landed between it and
+    now, they are left for stats_for() to rebuild.
+    """
+    with _lock:
+        stats = _stats.get(store.cache_key)
+        if stats is None or stats.version is None or stats.version != version_before:
+            return
+        after = store.version()
+        if not one_write_apart(version_before, after):
+            stats.version = None  # that other save isn't in the totals
+            return
+        stats.apply(old, new)
+        stats.version = after
+
+
+def forget(store):
+    with _lock:
+        _stats.pop(store.cache_key, None)
@@ -0,0 +1,133 @@
+# analytics.py
+import threading
+
+import numpy as np
+
+from metrics import timed
+from records import MOODS, iter_entries
+
+
+class Columns:
+    """The entry history as date-sorted NumPy arrays.
+
+    sleep and water are float64 with NaN where nothing was logged, mood holds
+    the index into records.MOODS (-1 for none) and period is a bool array.
+    """
+
+    def __init__(self, entries):
+        entries = list(entries)
+        dates = np.array([e.date for e in entries], dtype='datetime64[D]')
+        order = np.argsort(dates, kind='stable')
+        self.dates = dates[order]
+        self.sleep = np.array([np.nan if e.sleep is None else e.sleep for e in entries], dtype=np.float64)[order]
+        self.water = np.array([np.nan if e.water is None else e.water for e in entries], dtype=np.float64)[order]
+        self.mood = np.array([MOODS.index(e.mood) if e.mood else -1 for e in entries], dtype=np.int8)[order]
+        self.period = np.array([e.period for e in entries], dtype=bool)[order]
+
+    @classmethod
+    def from_arrays(cls, dates, sleep, water, mood, period):
+        """Columns over existing arrays (e.g. views of a binary store), not copied."""
+        cols = cls.__new__(cls)
+        cols.dates, cols.sleep, cols.water, cols.mood, cols.period = dates, sleep, water, mood, period
+        return cols
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Columns from a frames.load_frame() DataFrame (already sorted by date)."""
+        cols = cls.__new__(cls)
+        cols.dates = frame['date'].to_numpy().astype('datetime64[D]')
+        # float32 7.1 widens to 7.0999999; round back so goal checks match
+        cols.sleep = np.round(frame['sleep'].to_numpy(np.float64), 4)
+        cols.water = np.round(frame['water'].to_numpy(np.float64), 4)
+        cols.mood = frame['mood'].cat.codes.to_numpy(np.int8)
+        cols.period = frame['period'].to_numpy(bool)
+        return cols
+
+    def __len__(self):
+        return len(self.dates)
+
+
+_columns = {}
+_lock = threading.Lock()
+
+
+@timed("analytics.columns_for")
+def columns_for(store):
+    """Columns for ``store``, loaded once per store version."""
+    if hasattr(store, "columns"):
+        return store.columns()  # binary store: views of the mapped file, nothing to parse
+    version = store.version()
+    with _lock:
+        hit = _columns.get(store.cache_key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+    cols = Columns(iter_entries(store))
+    with _lock:
+        _columns[store.cache_key] = (version, cols)
+    return cols
+
+
+def forget(store):
+    with _lock:
+        _columns.pop(store.cache_key, None)
+
+
+def run_lengths(values):
+    """Run-length encode a 1-D array into (starts, lengths, run values)."""
+    values = np.asarray(values)
+    n = values.size
+    if n == 0:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty, values[:0]
+    starts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+    lengths = np.diff(np.append(starts, n))
+    return starts, lengths, values[starts]
+
+
+def goal_streaks(values, goal):
+    """(current, longest) run of logged days with ``value >= goal``.
+
+    Days with nothing logged (NaN) are left out rather than breaking a run.
+    """
+    # compare at the column's own precision: float32 7.1 must still meet a 7.1 goal
+    values = np.asarray(values)
+    hit = values[~np.isnan(values)] >= goal
+    if hit.size == 0:
+        return 0, 0
+    _, lengths, flags = run_lengths(hit)
+    longest = int(lengths[flags].max()) if flags.any() else 0
+    current = int(lengths[-1]) if flags[-1] else 0
+    return current, longest
+
+
+def goal_status(cols, sleep_goal, water_goal):
+    """Per-day goals met (0, 1 or 2) for days with both sleep and water logged.
+
+    Returns (dates, status) for those days only.
+    """
+    logged = ~np.isnan(cols.sleep) & ~np.isnan(cols.water)
+    status = (cols.sleep[logged] >= sleep_goal).astype(np.int8) + (cols.water[logged] >= water_goal)
+    return cols.dates[logged], status
+
+
+def rolling_mean(dates, values, days):
+    """Mean of the logged values in the ``days`` calendar days ending on each date.
+
+    ``dates`` must be sorted. NaNs are ignored; a window with no logged value
+    gives NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    logged = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(logged, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(logged)))
+    hi = np.arange(1, len(dates) + 1)
+    lo = np.searchsorted(dates, dates - np.timedelta64(days - 1, 'D'), side='left')
+    n = counts[hi] - counts[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, (sums[hi] - sums[lo]) / n, np.nan)
+
+
+def rolling_means(cols, windows=(7, 30)):
+    """{window: (sleep means, water means)} aligned with ``cols.dates``."""
+    return {w: (rolling_mean(cols.dates, cols.sleep, w), rolling_mean(cols.dates, cols.water, w))
+            for w in windows}
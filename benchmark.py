@@ -0,0 +1,218 @@
+# benchmark.py
+"""Synthetic data generator and timing harness for the tracker's hot paths.
+
+    python benchmark.py generate 100000 big.csv
+    python benchmark.py run --sizes 1000,10000,100000 --out bench.json
+    python benchmark.py compare old.json new.json
+
+`run` writes a JSON report (commit, Python version, per-size timings) so two
+commits can be compared with `compare`.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import analytics
+import period
+import storage
+from records import iter_entries, summarize
+from storage import HEADER
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+NOTES = ['', '', '', 'ok day', 'tired, headache', 'said "no" to coffee',
+         'long day\nslept badly', 'cramps 😣']
+END_DAY = date(2025, 8, 31)
+# Every day from date.min to END_DAY (~739k); only larger files repeat dates
+MAX_SPAN_DAYS = (END_DAY - date.min).days + 1
+
+
+def generate(path, rows, seed=0, shuffle_block=5000):
+    """Write a realistic tracker_data.csv with ``rows`` data rows.
+
+    Mixes full entries with blank calendar-created rows, repeats ~2% of dates,
+    shuffles within blocks so the file isn't sorted, and quotes notes that
+    hold commas, quotes and newlines. Memory stays bounded by the block size.
+    """
+    rng = random.Random(seed)
+    span = min(rows, MAX_SPAN_DAYS)
+    start = END_DAY - timedelta(days=span - 1)
+    cycle_day = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        block = []
+        for i in range(rows):
+            day = start + timedelta(days=i % span)
+            if block and rng.random() < 0.02:
+                day = date.fromisoformat(rng.choice(block)[0])  # duplicate date
+            cycle_day = (cycle_day + 1) % 29
+            on_period = 'yes' if cycle_day < 5 else 'no'
+            if rng.random() < 0.15:
+                block.append([day.isoformat(), '', '', '', on_period, ''])
+            else:
+                block.append([
+                    day.isoformat(),
+                    f"{rng.uniform(4, 10):.1f}",
+                    rng.choice(['Happy', 'Neutral', 'Low']),
+                    f"{rng.uniform(0.5, 4):.1f}",
+                    on_period,
+                    rng.choice(NOTES),
+                ])
+            if len(block) >= shuffle_block:
+                rng.shuffle(block)
+                writer.writerows(block)
+                block = []
+        rng.shuffle(block)
+        writer.writerows(block)
+
+
+def _time(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+
+
+def bench_store(store, repeat, sleep_goal=7.0, water_goal=2.0):
+    results = {}
+    cold = storage.invalidate_cache
+
+    results['read_all_entries'] = _time(store.read_all, repeat, setup=cold)
+    results['read_all_entries_cached'] = _time(store.read_all, repeat)
+
+    rows = store.read_all()
+    results['write_all_entries'] = _time(lambda: store.write_all(rows), repeat)
+
+    results['weekly_summary'] = _time(lambda: summarize(iter_entries(store)), repeat, setup=cold)
+
+    cols_holder = []
+    results['load_columns'] = _time(lambda: cols_holder.append(analytics.Columns(iter_entries(store))),
+                                    repeat, setup=cold)
+    cols = cols_holder[-1]
+    results['streaks'] = _time(lambda: (analytics.goal_streaks(cols.sleep, sleep_goal),
+                                        analytics.goal_streaks(cols.water, water_goal)), repeat)
+
+    period_dates = {r[0] for r in rows if len(r) >= 5 and r[4] == 'yes'}
+    results['group_period_streaks'] = _time(lambda: period.group_period_streaks(period_dates), repeat)
+
+    last = max(r[0] for r in rows)
+    year, month = int(last[:4]), int(last[5:7])
+    results['calendar_month'] = _time(lambda: period.month_status(store, year, month), repeat,
+                                      setup=lambda: period.forget_month(store))
+    return results
+
+
+def _commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(sizes, modes, repeat, workdir):
+    report = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'results': [],
+    }
+    for size in sizes:
+        data = os.path.join(workdir, f"bench_{size}.csv")
+        if not os.path.exists(data):
+            print(f"Generating {size:,} rows...")
+            generate(data, size)
+        for mode in modes:
+            # each mode gets its own copy since writes change the file
+            path = os.path.join(workdir, f"bench_{size}_{mode}.csv")
+            with open(data, 'rb') as src, open(path, 'wb') as dst:
+                dst.write(src.read())
+            bin_path = os.path.splitext(path)[0] + '.bin'
+            for leftover in [path + '.log', storage.sqlite_path_for(path), bin_path] + glob.glob(bin_path + '.notes.*'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            shutil.rmtree(storage.partition_dir_for(path), ignore_errors=True)
+            store = storage.open_store(path, mode)
+            print(f"Timing {size:,} rows ({mode})...")
+            # distinct dates held: the file's duplicate dates collapse to one row
+            report['results'].append({'rows': size, 'mode': mode, 'count': store.count(),
+                                      'timings': bench_store(store, repeat)})
+    return report
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    before = {(r['rows'], r['mode'], op): t['median']
+              for r in old['results'] for op, t in r['timings'].items()}
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    print(f"{'rows':>10} {'mode':<7} {'operation':<26} {'old (s)':>10} {'new (s)':>10} {'ratio':>7}")
+    for r in new['results']:
+        for op, t in r['timings'].items():
+            prev = before.get((r['rows'], r['mode'], op))
+            if prev is None:
+                continue
+            ratio = t['median'] / prev if prev else float('inf')
+            flag = '  <-- slower' if ratio > 1.2 else ''
+            print(f"{r['rows']:>10} {r['mode']:<7} {op:<26} {prev:>10.4f} {t['median']:>10.4f} {ratio:>7.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lifestyle Tracker benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    g = sub.add_parser('generate', help='write a synthetic tracker_data.csv')
+    g.add_argument('rows', type=int)
+    g.add_argument('path')
+    g.add_argument('--seed', type=int, default=0)
+
+    r = sub.add_parser('run', help='time the hot paths and write a JSON report')
+    r.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                   help='comma-separated row counts (e.g. 1000,10000000)')
+    r.add_argument('--modes', default='csv', help='comma-separated storage modes: csv,log,sqlite,partitioned,binary')
+    r.add_argument('--repeat', type=int, default=3)
+    r.add_argument('--workdir', default=None, help='where to keep generated data (default: a temp dir)')
+    r.add_argument('--out', default='bench_results.json')
+
+    c = sub.add_parser('compare', help='compare two JSON reports')
+    c.add_argument('old')
+    c.add_argument('new')
+
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        generate(args.path, args.rows, seed=args.seed)
+        print(f"✅ Wrote {args.rows:,} rows to {args.path}")
+    elif args.command == 'run':
+        sizes = [int(s) for s in args.sizes.split(',') if s]
+        modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+        workdir = args.workdir or tempfile.mkdtemp(prefix='tracker_bench_')
+        os.makedirs(workdir, exist_ok=True)
+        report = run(sizes, modes, args.repeat, workdir)
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"📁 Report written to {args.out}")
+    else:
+        compare(args.old, args.new)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,480 @@
+# binstore.py
+"""Fixed-width binary store for the numeric history, read through mmap.
+
+    tracker_data.bin          32-byte header + one 32-byte record per day
+    tracker_data.bin.notes.0  UTF-8 notes, addressed by (offset, length)
+
+Records are laid out by day: slot ``i`` holds the day ``base_day + i``
+(days since 1970-01-01), so finding a date is an index, not a search. Days
+without an entry are empty slots with NaN sleep/water, which the NumPy
+analytics already treat as "not logged". The file is mapped with
+np.memmap and the columns handed out are views into the mapping, so
+streaks and averages run without parsing or copying the history.
+
+A save rewrites only its own record (and appends its notes). Adding a day
+before the first one, or write_all(), rewrites both files; the notes file
+then moves to the next generation so the old pair stays valid until the
+new header is renamed into place.
+
+Only rows that records.parse_row() accepts can be stored; anything else
+raises BadRow.
+"""
+import os
+import struct
+import tempfile
+import threading
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+from metrics import timed
+from records import MOODS, BadRow, parse_row
+from storage import (ANY, DATA_FILE, ITER_CHUNK, PAGE_SIZE, CsvStore, _cache_get, _cache_put, _check_expected,
+                     _fsync_dir, _text_row, _umask, file_lock, file_version, invalidate_cache)
+
+MAGIC = b"TRKBIN1\0"
+# magic, base day, notes generation, change counter, reserved
+_HEADER = struct.Struct("<8siIQ8x")
+HEADER_SIZE = _HEADER.size
+RECORD = np.dtype([
+    ("day", "<i4"),  # days since 1970-01-01; only meaningful when used
+    ("sleep", "<f4"),  # NaN when not logged
+    ("water", "<f4"),
+    ("mood", "i1"),  # index into MOODS, -1 for none
+    ("period", "u1"),
+    ("used", "u1"),
+    ("_pad", "u1"),
+    ("notes_off", "<u8"),
+    ("notes_len", "<u4"),
+    ("_pad2", "<u4"),
+])
+EPOCH = date(1970, 1, 1).toordinal()
+_EPOCH64 = np.datetime64("1970-01-01", "D")
+
+
+def _empty(n):
+    recs = np.zeros(n, dtype=RECORD)
+    recs["sleep"] = np.nan
+    recs["water"] = np.nan
+    recs["mood"] = -1
+    return recs
+
+
+@lru_cache(maxsize=4096)
+def _fmt(value):
+    # shortest text that reads back as the same float32 ("7.1", not 7.0999999)
+    return np.format_float_positional(np.float32(value), trim="-")
+
+
+def binary_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + ".bin"
+
+
+class BinaryStore:
+    """Entries as fixed-width day records in an mmap'd file; see module docstring."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.cache_key = ("binary", os.path.abspath(path))
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._map = None  # ((dev, ino, size), raw uint8 memmap)
+
+    # -----------------------
+    # Mapping
+    # -----------------------
+    def notes_path(self, generation):
+        return f"{self.path}.notes.{generation}"
+
+    def ensure_file(self):
+        if not os.path.exists(self.path):
+            with file_lock(self.lock_path):
+                if not os.path.exists(self.path):
+                    self._replace(0, _empty(0), b"", 0)
+
+    def _mapped(self):
+        """(header fields, record view) of the file as it is now; remaps if it was replaced or grew."""
+        self.ensure_file()
+        st = os.stat(self.path)
+        ident = (st.st_dev, st.st_ino, st.st_size)
+        with self._lock:
+            if self._map is None or self._map[0] != ident:
+                # the old mapping stays alive for as long as views of it are in use
+                self._map = (ident, np.memmap(self.path, dtype=np.uint8, mode="r"))
+            raw = self._map[1]
+        magic, base, notes_gen, changes = _HEADER.unpack(raw[:HEADER_SIZE].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a tracker binary file")
+        n = (len(raw) - HEADER_SIZE) // RECORD.itemsize
+        recs = raw[HEADER_SIZE:HEADER_SIZE + n * RECORD.itemsize].view(RECORD)
+        return (base, notes_gen, changes), recs
+
+    def version(self):
+        # the change counter catches in-place edits from other processes that
+        # land within the filesystem's mtime granularity
+        (_, _, changes), _ = self._mapped()
+        return (self._writes, file_version(self.path), changes)
+
+    def _invalidate(self):
+        self._writes += 1
+        invalidate_cache(self.cache_key)
+
+    def _notes(self, notes_gen):
+        try:
+            with open(self.notes_path(notes_gen), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return b""
+
+    # -----------------------
+    # Reads
+    # -----------------------
+    def _rows(self, recs, slots, base, notes_gen, notes=None):
+        """Text rows, as the other stores return them, for the given slots.
+
+        ``notes`` is the whole notes file when it's already in memory;
+        otherwise each row's notes are read on their own.
+        """
+        slots = np.asarray(slots, dtype=np.intp)
+        sub = recs[slots]
+        moods = [""] + MOODS  # mood -1 -> ""
+        if notes is None and len(slots):
+            try:
+                with open(self.notes_path(notes_gen), "rb") as f:
+                    texts = []
+                    for off, length in zip(sub["notes_off"].tolist(), sub["notes_len"].tolist()):
+                        f.seek(off)
+                        texts.append(f.read(length))
+            except FileNotFoundError:
+                texts = [b""] * len(slots)
+            notes = b"".join(texts)
+            ends = np.cumsum([len(t) for t in texts])
+            sub["notes_off"] = ends - sub["notes_len"]
+        rows = []
+        for i, sleep, mood, water, period, off, length in zip(
+                slots.tolist(), sub["sleep"].tolist(), sub["mood"].tolist(), sub["water"].tolist(),
+                sub["period"].tolist(), sub["notes_off"].tolist(), sub["notes_len"].tolist()):
+            rows.append([
+                date.fromordinal(EPOCH + base + i).isoformat(),
+                "" if sleep != sleep else _fmt(sleep),  # NaN != NaN
+                moods[mood + 1],
+                "" if water != water else _fmt(water),
+                "yes" if period else "no",
+                notes[off:off + length].decode("utf-8") if length else "",
+            ])
+        return rows
+
+    def _slots(self, recs, lo=0, hi=None):
+        return lo + np.flatnonzero(recs["used"][lo:hi])
+
+    @timed("store.read_all")
+    def read_all(self):
+        version = self.version()
+        rows = _cache_get(self.cache_key, version)
+        if rows is None:
+            (base, notes_gen, _), recs = self._mapped()
+            rows = self._rows(recs, self._slots(recs), base, notes_gen, self._notes(notes_gen))
+            _cache_put(self.cache_key, version, rows)
+        return list(rows)
+
+    def iter_rows(self):
+        """Yield rows ITER_CHUNK slots at a time from one mapping of the file."""
+        cached = _cache_get(self.cache_key, self.version())
+        if cached is not None:
+            yield from cached
+            return
+        (base, notes_gen, _), recs = self._mapped()
+        for lo in range(0, len(recs), ITER_CHUNK):
+            yield from self._rows(recs, self._slots(recs, lo, lo + ITER_CHUNK), base, notes_gen)
+
+    def tail(self, n):
+        """The ``n`` latest dates, oldest first."""
+        if n <= 0:
+            return []
+        (base, notes_gen, _), recs = self._mapped()
+        return self._rows(recs, self._slots(recs)[-n:], base, notes_gen)
+
+    def _slot_of(self, day, base):
+        try:
+            return date.fromisoformat(str(day).strip()).toordinal() - EPOCH - base
+        except ValueError:
+            return None
+
+    def get(self, day):
+        """O(1): the record's position follows from the date."""
+        (base, notes_gen, _), recs = self._mapped()
+        i = self._slot_of(day, base)
+        if i is None or not 0 <= i < len(recs) or not recs[i]["used"]:
+            return None
+        return self._rows(recs, [i], base, notes_gen)[0]
+
+    def _span(self, recs, base, start, end):
+        lo = 0 if start is None else max(0, self._slot_of(start, base) or 0)
+        hi = len(recs) if end is None else min(len(recs), (self._slot_of(end, base) or 0) + 1)
+        return lo, max(lo, hi)
+
+    def range(self, start, end):
+        (base, notes_gen, _), recs = self._mapped()
+        lo, hi = self._span(recs, base, start, end)
+        if lo >= hi:
+            return []
+        return self._rows(recs, self._slots(recs, lo, hi), base, notes_gen)
+
+    def count(self, start=None, end=None):
+        (base, _, _), recs = self._mapped()
+        lo, hi = self._span(recs, base, start, end)
+        return int(np.count_nonzero(recs["used"][lo:hi]))
+
+    def page(self, offset=0, limit=PAGE_SIZE, start=None, end=None, newest_first=False):
+        """One page of the range; only its records and notes are decoded."""
+        (base, notes_gen, _), recs = self._mapped()
+        lo, hi = self._span(recs, base, start, end)
+        slots = self._slots(recs, lo, hi)
+        if newest_first:
+            slots = slots[::-1]
+        return self._rows(recs, slots[offset:offset + limit], base, notes_gen)
+
+    def dates(self):
+        (base, _, _), recs = self._mapped()
+        return [date.fromordinal(EPOCH + base + int(i)).isoformat() for i in self._slots(recs)]
+
+    def columns(self):
+        """analytics.Columns whose sleep/water/mood/period are views of the mapping.
+
+        Every day from the first to the last entry is included; days with
+        nothing logged have NaN sleep/water, mood -1 and period False.
+        """
+        from analytics import Columns
+
+        (base, _, _), recs = self._mapped()
+        dates = _EPOCH64 + base + np.arange(len(recs))
+        return Columns.from_arrays(dates, recs["sleep"], recs["water"], recs["mood"],
+                                   recs["period"].view(bool))
+
+    @timed("store.summary")
+    def summary(self):
+        """The numbers records.summarize() reports, straight from the mapped arrays."""
+        _, recs = self._mapped()
+        sleep, water, mood = recs["sleep"], recs["water"], recs["mood"]
+        sleep_days = int(np.count_nonzero(~np.isnan(sleep)))
+        water_days = int(np.count_nonzero(~np.isnan(water)))
+        counts = np.bincount(mood[mood >= 0], minlength=len(MOODS))
+        return {
+            'entries': int(np.count_nonzero(recs["used"])),
+            'sleep_days': sleep_days,
+            'water_days': water_days,
+            'avg_sleep': float(np.nansum(sleep, dtype=np.float64) / sleep_days) if sleep_days else None,
+            'avg_water': float(np.nansum(water, dtype=np.float64) / water_days) if water_days else None,
+            'mood_counts': {m: int(n) for m, n in zip(MOODS, counts)},
+            'period_days': int(np.count_nonzero(recs["period"])),
+        }
+
+    # -----------------------
+    # Writes
+    # -----------------------
+    @staticmethod
+    def _parse(row):
+        e = parse_row(_text_row(row))
+        return e.date.toordinal() - EPOCH, e
+
+    @staticmethod
+    def _record(day, e, off, length):
+        rec = _empty(1)
+        rec["day"] = day
+        if e.sleep is not None:
+            rec["sleep"] = e.sleep
+        if e.water is not None:
+            rec["water"] = e.water
+        rec["mood"] = MOODS.index(e.mood) if e.mood else -1
+        rec["period"] = e.period
+        rec["used"] = 1
+        rec["notes_off"] = off
+        rec["notes_len"] = length
+        return rec
+
+    def _replace(self, base, recs, notes, notes_gen, changes=0):
+        """Write a whole new notes file and data file; the data file's rename commits both."""
+        notes_path = self.notes_path(notes_gen)
+        with open(notes_path, "wb") as f:
+            f.write(notes)
+            f.flush()
+            os.fsync(f.fileno())
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(MAGIC, base, notes_gen, changes))
+                f.write(recs.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o666 & ~_umask())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        _fsync_dir(self.path)
+        prefix = os.path.basename(self.path) + ".notes."
+        for name in os.listdir(directory):  # earlier generations
+            if name.startswith(prefix) and name != os.path.basename(notes_path):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def _save(self, updates, check=None, replace_all=False):
+        """Apply {day: Entry or None} under the file lock.
+
+        In place when every day fits at or after the first slot; otherwise
+        (or for replace_all) both files are rewritten.
+        """
+        self.ensure_file()  # before the lock: ensure_file takes it itself
+        with file_lock(self.lock_path):
+            (base, notes_gen, changes), recs = self._mapped()
+            if check is not None:
+                check(recs, base, notes_gen)
+            used = self._slots(recs)
+            new_days = [d for d, e in updates.items() if e is not None]
+            if not replace_all and (not new_days or (len(used) and min(new_days) >= base)):
+                self._save_in_place(updates, base, notes_gen, changes, recs)
+            else:
+                self._rewrite(updates, base, notes_gen, changes, recs, used, replace_all)
+            with self._lock:
+                self._invalidate()
+
+    def _save_in_place(self, updates, base, notes_gen, changes, recs):
+        n = len(recs)
+        with open(self.notes_path(notes_gen), "ab") as f:
+            # notes first: a record never points past the end of its notes
+            pending = []
+            for day, e in sorted(updates.items()):
+                off = f.tell()
+                text = e.notes.encode("utf-8") if e is not None else b""
+                f.write(text)
+                pending.append((day, e, off, len(text)))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.path, "r+b") as f:
+            last = max((day for day, e, _, _ in pending if e is not None), default=base - 1) - base
+            if last >= n:
+                f.seek(HEADER_SIZE + n * RECORD.itemsize)
+                f.write(_empty(last + 1 - n).tobytes())
+            for day, e, off, length in pending:
+                i = day - base
+                if e is None:
+                    if not 0 <= i < n:
+                        continue
+                    rec = _empty(1)
+                else:
+                    rec = self._record(day, e, off, length)
+                f.seek(HEADER_SIZE + i * RECORD.itemsize)
+                f.write(rec.tobytes())
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, base, notes_gen, changes + 1))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self, updates, base, notes_gen, changes, recs, used, replace_all):
+        old_notes = self._notes(notes_gen)
+        kept = {} if replace_all else {base + int(i): int(i) for i in used}  # day -> old slot
+        for day in updates:
+            kept.pop(day, None)
+        new = {day: e for day, e in updates.items() if e is not None}
+        days = sorted(kept.keys() | new.keys())
+        new_base = days[0] if days else 0
+        out = _empty(days[-1] - new_base + 1 if days else 0)
+
+        if kept:
+            old_days = np.fromiter(kept.keys(), dtype=np.int64, count=len(kept))
+            out[old_days - new_base] = recs[np.fromiter(kept.values(), dtype=np.intp, count=len(kept))]
+        if new:
+            slots = np.fromiter(new.keys(), dtype=np.int64, count=len(new)) - new_base
+            es = list(new.values())
+            out["day"][slots] = list(new.keys())
+            out["sleep"][slots] = [np.nan if e.sleep is None else e.sleep for e in es]
+            out["water"][slots] = [np.nan if e.water is None else e.water for e in es]
+            out["mood"][slots] = [MOODS.index(e.mood) if e.mood else -1 for e in es]
+            out["period"][slots] = [e.period for e in es]
+            out["used"][slots] = 1
+
+        # repack the notes in date order, dropping text no record points to
+        texts = []
+        for day in days:
+            if day in new:
+                texts.append(new[day].notes.encode("utf-8"))
+            else:
+                r = recs[kept[day]]
+                off = int(r["notes_off"])
+                texts.append(old_notes[off:off + int(r["notes_len"])])
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        slots = np.asarray(days, dtype=np.int64) - new_base
+        out["notes_len"][slots] = lengths
+        out["notes_off"][slots] = np.cumsum(lengths) - lengths
+        self._replace(new_base, out, b"".join(texts), notes_gen + 1, changes + 1)
+
+    def _change(self, day, expected, entry):
+        def check(recs, base, notes_gen):
+            i = self._slot_of(day, base)
+            current = None
+            if i is not None and 0 <= i < len(recs) and recs[i]["used"]:
+                current = self._rows(recs, [i], base, notes_gen)[0]
+            _check_expected(current, expected, day)
+        ordinal = self._slot_of(day, 0)
+        if ordinal is None:
+            if entry is None:
+                return  # nothing with an unreadable date can be stored
+            raise BadRow(f"bad date: {day!r}")
+        self._save({ordinal: entry}, check if expected is not ANY else None)
+
+    @timed("store.upsert")
+    def upsert(self, row, expected=ANY):
+        _, entry = self._parse(row)
+        self._change(_text_row(row)[0], expected, entry)
+
+    def append(self, row):
+        self.upsert(row)
+
+    @timed("store.delete")
+    def delete(self, day, expected=ANY):
+        self._change(day, expected, None)
+
+    @timed("store.upsert_many")
+    def upsert_many(self, rows):
+        updates = dict(self._parse(r) for r in rows if r)  # later rows win
+        if updates:
+            self._save(updates)
+
+    @timed("store.write_all")
+    def write_all(self, rows):
+        self._save(dict(self._parse(r) for r in rows if r), replace_all=True)
+
+    def close(self):
+        with self._lock:
+            self._map = None
+
+
+def migrate_csv_to_binary(csv_path=DATA_FILE, bin_path=None, on_bad=None):
+    """One-shot copy of an existing CSV into a binary store.
+
+    Later rows win when a date appears more than once. Rows the binary format
+    can't hold (bad dates or values) go to ``on_bad(row, reason)``. Returns
+    the number of dates stored.
+    """
+    bin_path = bin_path or binary_path_for(csv_path)
+    rows = CsvStore(csv_path).read_all() if os.path.exists(csv_path) else []
+    updates = {}
+    for row in rows:
+        if not row:
+            continue
+        try:
+            day, entry = BinaryStore._parse(row)
+        except BadRow as e:
+            if on_bad is not None:
+                on_bad(row, str(e))
+            continue
+        updates[day] = entry  # later rows win
+    store = BinaryStore(bin_path)
+    store._save(updates, replace_all=True)
+    return len(updates)
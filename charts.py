@@ -0,0 +1,148 @@
+# charts.py
+"""Chart drawing shared by the CLI and the app, plus a headless PNG/SVG cache.
+
+render() draws off-screen with the Agg backend and names each file after a
+hash of the chart type, the goals and the data drawn, so an unchanged chart
+is served straight from disk. The cache directory is trimmed to
+``CHART_CACHE_BYTES``, dropping the least recently used images first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import analytics
+import frames
+from metrics import timed
+
+CHART_DIR = os.environ.get("TRACKER_CHART_DIR", ".chart_cache")
+CHART_CACHE_BYTES = int(float(os.environ.get("TRACKER_CHART_CACHE_MB", "50")) * 1024 * 1024)
+CHARTS = ("weekly", "streaks")
+STATUS_COLORS = {0: 'lightcoral', 1: 'gold', 2: 'lightgreen'}
+
+_lock = threading.Lock()
+
+
+def draw_weekly(fig, summary):
+    """Mood counts and average sleep/water side by side."""
+    mood_counts = summary['mood_counts']
+    axs = fig.subplots(1, 2)
+
+    axs[0].bar(list(mood_counts.keys()), list(mood_counts.values()), color='plum')
+    axs[0].set_title('Mood Trends')
+    axs[0].set_ylabel('Count')
+
+    axs[1].bar(['Avg Sleep', 'Avg Water'], [summary['avg_sleep'] or 0, summary['avg_water'] or 0],
+               color=['skyblue', 'lightgreen'])
+    axs[1].set_title('Weekly Averages')
+    axs[1].set_ylabel('Values')
+    fig.tight_layout()
+
+
+def draw_streaks(fig, days, status, goals):
+    """One bar per day: 0 = missed both goals, 1 = met one, 2 = met both."""
+    dates = [d.strftime("%b %d") for d in days.astype(object)]
+    status = status.tolist()
+    ax = fig.subplots()
+    ax.bar(dates, status, color=[STATUS_COLORS[v] for v in status], edgecolor='black')
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.set_ylim(0, 2.5)
+    ax.set_yticks([0, 1, 2], ['Missed Both', 'One Goal', 'Both Goals'])
+    ax.set_title(f'Daily Goal Streaks (Sleep ≥ {goals["sleep_goal"]}h, Water ≥ {goals["water_goal"]}L)')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Goals Met')
+    ax.grid(axis='y', linestyle='--', alpha=0.5)
+    fig.tight_layout()
+
+
+def chart_data(kind, store, goals):
+    """What a chart draws, or None if there's nothing to draw."""
+    if kind == "weekly":
+        summary = frames.frame_summary(frames.load_frame(store))  # shared with the app's pages
+        if summary['avg_sleep'] is None and summary['avg_water'] is None:
+            return None
+        return summary
+    cols = analytics.columns_for(store)
+    days, status = analytics.goal_status(cols, goals['sleep_goal'], goals['water_goal'])
+    return (days, status) if len(days) else None
+
+
+def _digest(kind, goals, data, fmt):
+    h = hashlib.sha256()
+    h.update(json.dumps([kind, fmt, goals['sleep_goal'], goals['water_goal']]).encode())
+    if kind == "weekly":
+        h.update(json.dumps(data, sort_keys=True).encode())
+    else:
+        for arr in data:
+            h.update(arr.tobytes())
+    return h.hexdigest()[:32]
+
+
+def _draw(kind, data, goals, path, fmt):
+    # Figure + Agg canvas rather than pyplot: no display, no global state,
+    # safe on Streamlit's worker threads
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(12, 5))
+    FigureCanvasAgg(fig)
+    if kind == "weekly":
+        draw_weekly(fig, data)
+    else:
+        draw_streaks(fig, data[0], data[1], goals)
+    fd, tmp = tempfile.mkstemp(suffix="." + fmt, dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        fig.savefig(tmp, format=fmt)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _trim(cache_dir, max_bytes, keep):
+    files = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if path == keep:
+            continue
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files) + os.path.getsize(keep)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+@timed("charts.render")
+def render(kind, store, goals, fmt="png", cache_dir=None, max_bytes=None):
+    """Path of a ``kind`` chart ("weekly" or "streaks") as PNG or SVG.
+
+    Returns None when there is no data to plot.
+    """
+    if kind not in CHARTS:
+        raise ValueError(f"Unknown chart: {kind!r}")
+    cache_dir = cache_dir or CHART_DIR
+    goals = {'sleep_goal': float(goals['sleep_goal']), 'water_goal': float(goals['water_goal'])}
+    data = chart_data(kind, store, goals)
+    if data is None:
+        return None
+    path = os.path.join(cache_dir, f"{kind}-{_digest(kind, goals, data, fmt)}.{fmt}")
+    with _lock:
+        if os.path.exists(path):
+            os.utime(path)  # mtime is the LRU clock
+            return path
+        os.makedirs(cache_dir, exist_ok=True)
+        _draw(kind, data, goals, path, fmt)
+        _trim(cache_dir, CHART_CACHE_BYTES if max_bytes is None else max_bytes, keep=path)
+    return path
@@ -0,0 +1,395 @@
+# cli.py
+"""Non-interactive tracker commands for scripts, cron jobs and pipelines.
+
+    python cli.py add --sleep 7.5 --mood happy --water 2 --period no
+    python cli.py last -n 7 --json
+    python cli.py list --page 3 --limit 50 --start 2025-01-01 --desc
+    python cli.py summary --streaks
+    python cli.py summary --month 2025-08
+    python cli.py export --format json --out entries.json
+    python cli.py export --format parquet --out entries_parquet --all-users
+    python cli.py period-days
+    python cli.py calendar --month 2025-08
+    python cli.py plot streaks --out streaks.png
+
+`python tracker.py <command> ...` runs the same commands; with no arguments
+tracker.py starts the interactive menu. Only what a command needs is
+imported, so matplotlib and NumPy load just for plots and streaks.
+"""
+import argparse
+import calendar
+import csv
+import json
+import sys
+from datetime import date
+
+import metrics
+from records import BadRow, iter_entries, last_days, month_of, parse_row, range_summary, summarize
+from storage import HEADER, PAGE_SIZE, open_store
+
+CONFIG_FILE = 'config.json'
+DEFAULT_GOALS = {'sleep_goal': 7.0, 'water_goal': 2.0}
+
+
+def load_goals(path=CONFIG_FILE):
+    """Goals from config.json, or the defaults; never prompts."""
+    try:
+        with open(path, 'r') as f:
+            return {**DEFAULT_GOALS, **json.load(f)}
+    except (OSError, ValueError):
+        return dict(DEFAULT_GOALS)
+
+
+def _profile_cycle(path='profile.json'):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get('cycle_length')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _shard(args):
+    import users
+    return users.UserShard(args.user, mode=args.storage)
+
+
+def _store(args):
+    if args.user:
+        return _shard(args).store
+    return open_store(args.data, args.storage)
+
+
+def _goals(args):
+    """Goals of the --user shard, or from ./config.json."""
+    return load_goals(_shard(args).config_path if args.user else CONFIG_FILE)
+
+
+def _cycle(args):
+    return _profile_cycle(_shard(args).profile_path if args.user else 'profile.json')
+
+
+# -----------------------
+# Argument types
+# -----------------------
+def _date_arg(text):
+    """YYYY-MM-DD -> date."""
+    try:
+        if len(text) != 10:
+            raise ValueError
+        return date.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM-DD date: {text!r}") from None
+
+
+def _month_arg(text):
+    """YYYY-MM -> (year, month)."""
+    try:
+        if len(text) != 7:
+            raise ValueError
+        day = date.fromisoformat(text + '-01')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM month: {text!r}") from None
+    return day.year, day.month
+
+
+def _user_arg(text):
+    import users
+    try:
+        users.shard_dir(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return text
+
+
+def _emit(args, data, text_lines):
+    if args.json:
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        for line in text_lines:
+            print(line)
+
+
+def _entry_dict(e):
+    return {'date': e.date.isoformat(), 'sleep': e.sleep, 'mood': e.mood, 'water_intake': e.water,
+            'period': e.period, 'notes': e.notes}
+
+
+def _entry_row(e):
+    def num(v):
+        return '' if v is None else f"{v:g}"
+    return [e.date.isoformat(), num(e.sleep), e.mood or '', num(e.water), 'yes' if e.period else 'no', e.notes]
+
+
+def cmd_add(args):
+    day = args.date or date.today().isoformat()
+    row = [day, '' if args.sleep is None else str(args.sleep), args.mood or '',
+           '' if args.water is None else str(args.water), args.period, args.notes]
+    try:
+        entry = parse_row(row)  # same rules as the forms
+    except BadRow as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    row[0], row[2] = entry.date.isoformat(), entry.mood or ''
+    _store(args).upsert(row)
+    _emit(args, _entry_dict(entry), [f"✅ Saved {row[0]}"])
+    return 0
+
+
+def cmd_last(args):
+    rows = _store(args).tail(args.n)
+    _emit(args, [dict(zip(HEADER, r)) for r in rows], [', '.join(r) for r in rows])
+    return 0
+
+
+def cmd_list(args):
+    """One page of entries; only that page is read from the store."""
+    store = _store(args)
+    limit = max(1, args.limit)
+    start = args.start.isoformat() if args.start else None
+    end = args.end.isoformat() if args.end else None
+    total = store.count(start, end)
+    pages = max(1, -(-total // limit))
+    page = min(max(1, args.page), pages)
+    rows = store.page((page - 1) * limit, limit, start, end, args.desc)
+    data = {'page': page, 'pages': pages, 'limit': limit, 'total': total,
+            'entries': [dict(zip(HEADER, r)) for r in rows]}
+    lines = [', '.join(r) for r in rows] + [f"Page {page} of {pages} ({total} entries)"]
+    _emit(args, data, lines)
+    return 0
+
+
+def _summary_span(args):
+    """(start, end) asked for on the command line, or None for the whole history."""
+    if args.month:
+        return month_of(*args.month)
+    if args.week:
+        return last_days(7)
+    if args.start:
+        return args.start, args.end or date.today()
+    return None
+
+
+def cmd_summary(args):
+    store = _store(args)
+    span = _summary_span(args)
+    if span:
+        s = range_summary(*span, store=store)  # reads only the rows in the range
+    elif hasattr(store, 'summary'):
+        s = store.summary()  # binary store: straight from the mapped arrays
+    else:
+        s = summarize(iter_entries(store))
+    data = {k: s[k] for k in ('entries', 'avg_sleep', 'avg_water', 'mood_counts', 'period_days')}
+    lines = []
+    if span:
+        data['start'], data['end'] = span[0].isoformat(), span[1].isoformat()
+        lines.append(f"From {data['start']} to {data['end']}")
+    lines += [
+        f"Entries: {s['entries']}",
+        f"Average Sleep: {s['avg_sleep'] or 0:.1f} hrs",
+        f"Average Water Intake: {s['avg_water'] or 0:.1f} L",
+        f"Mood Counts: {s['mood_counts']}",
+        f"Period days: {s['period_days']}",
+    ]
+    if args.streaks:
+        import analytics
+        goals = _goals(args)
+        cols = analytics.columns_for(store)
+        sleep = analytics.goal_streaks(cols.sleep, goals['sleep_goal'])
+        water = analytics.goal_streaks(cols.water, goals['water_goal'])
+        data['sleep_streak'] = {'goal': goals['sleep_goal'], 'current': sleep[0], 'longest': sleep[1]}
+        data['water_streak'] = {'goal': goals['water_goal'], 'current': water[0], 'longest': water[1]}
+        lines.append(f"Sleep streak: {sleep[0]} day(s) with ≥{goals['sleep_goal']} hrs (Longest: {sleep[1]})")
+        lines.append(f"Water streak: {water[0]} day(s) with ≥{goals['water_goal']}L (Longest: {water[1]})")
+    _emit(args, data, lines)
+    return 0
+
+
+def _export_columnar(args):
+    import columnar
+
+    if not args.out:
+        print(f"❌ --format {args.format} writes a directory; pass --out", file=sys.stderr)
+        return 2
+    if args.all_users:
+        import users
+        reg = users.registry()
+        shards = ((u, reg.get(u).store) for u in reg.users())
+        store = None
+    else:
+        shards, store = None, _store(args)
+    try:
+        n = columnar.export_entries(args.out, store=store, shards=shards, fmt=args.format,
+                                    partition=args.partition, overwrite=args.overwrite)
+    except (RuntimeError, FileExistsError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    print(f"📁 Exported {n} entries to {args.out}", file=sys.stderr)
+    return 0
+
+
+def cmd_export(args):
+    if args.format in ('parquet', 'arrow'):
+        return _export_columnar(args)
+    entries = iter_entries(_store(args))
+    out = open(args.out, 'w', newline='') if args.out else sys.stdout
+    try:
+        if args.format == 'json':
+            for e in entries:
+                out.write(json.dumps(_entry_dict(e)) + '\n')
+        else:
+            writer = csv.writer(out)
+            writer.writerow(HEADER)
+            for e in entries:
+                writer.writerow(_entry_row(e))
+    finally:
+        if args.out:
+            out.close()
+    if args.out:
+        print(f"📁 Exported to {args.out}", file=sys.stderr)
+    return 0
+
+
+def cmd_period_days(args):
+    days = [e.date.isoformat() for e in iter_entries(_store(args)) if e.period]
+    _emit(args, days, days)
+    return 0
+
+
+def cmd_calendar(args):
+    import cycles
+    import period
+
+    if args.month:
+        year, month = args.month
+    else:
+        year, month = date.today().year, date.today().month
+    store = _store(args)
+    status = period.month_status(store, year, month)
+    days = [d for d in range(1, len(status)) if status[d] & period.PERIOD]
+    predicted = cycles.predicted_days(cycles.cycles_for(store).predict(_cycle(args), after=date(year, month, 1)),
+                                      year, month)
+    lines = [f"{calendar.month_name[month]} {year}", "Mo Tu We Th Fr Sa Su"]
+    for week in calendar.Calendar().monthdayscalendar(year, month):
+        cells = []
+        for d in week:
+            if d == 0:
+                cells.append('  ')
+            elif status[d] & period.PERIOD:
+                cells.append(' *')
+            elif status[d] & period.TODAY:
+                cells.append(' T')
+            elif d in predicted:
+                cells.append(' ~')
+            else:
+                cells.append(f"{d:2d}")
+        lines.append(' '.join(cells))
+    lines.append("* = period day, T = today, ~ = predicted")
+    _emit(args, {'year': year, 'month': month, 'period_days': days, 'predicted_days': sorted(predicted)},
+          lines)
+    return 0
+
+
+def cmd_plot(args):
+    if args.out:
+        import shutil
+        import charts
+
+        fmt = 'svg' if args.out.lower().endswith('.svg') else 'png'
+        path = charts.render(args.chart, _store(args), _goals(args), fmt=fmt)
+        if path is None:
+            print("No data to plot.", file=sys.stderr)
+            return 1
+        shutil.copyfile(path, args.out)
+        print(f"📁 Chart written to {args.out}", file=sys.stderr)
+        return 0
+
+    import matplotlib.pyplot as plt  # only when a chart is asked for
+    import charts
+
+    goals = _goals(args)
+    data = charts.chart_data(args.chart, _store(args), goals)
+    if data is None:
+        print("No data to plot.", file=sys.stderr)
+        return 1
+    fig = plt.figure(figsize=(12, 5))
+    if args.chart == 'weekly':
+        charts.draw_weekly(fig, data)
+    else:
+        charts.draw_streaks(fig, data[0], data[1], goals)
+    plt.show()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='tracker', description="Lifestyle Tracker commands")
+    parser.add_argument('--data', default='tracker_data.csv', help='data file (default: tracker_data.csv)')
+    parser.add_argument('--storage', default=None, help='storage mode (default: TRACKER_STORAGE or csv)')
+    parser.add_argument('--user', type=_user_arg, default=None, help="use this user's shard")
+    parser.add_argument('--json', action='store_true', help='print JSON instead of text')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    a = sub.add_parser('add', help="save an entry (today's unless --date)")
+    a.add_argument('--date', default=None, help='YYYY-MM-DD (default: today)')
+    a.add_argument('--sleep', type=float, default=None, help='hours')
+    a.add_argument('--mood', default=None, help='Happy, Neutral or Low')
+    a.add_argument('--water', type=float, default=None, help='litres')
+    a.add_argument('--period', choices=['yes', 'no'], default='no')
+    a.add_argument('--notes', default='')
+    a.set_defaults(func=cmd_add)
+
+    la = sub.add_parser('last', help='the entries for the latest dates, oldest first')
+    la.add_argument('-n', type=int, default=5)
+    la.set_defaults(func=cmd_last)
+
+    li = sub.add_parser('list', help='entries one page at a time, oldest first')
+    li.add_argument('--page', type=int, default=1, help='1-based page number (default: 1)')
+    li.add_argument('--limit', type=int, default=PAGE_SIZE, help=f'entries per page (default: {PAGE_SIZE})')
+    li.add_argument('--start', type=_date_arg, default=None, help='only from this date (YYYY-MM-DD)')
+    li.add_argument('--end', type=_date_arg, default=None, help='only up to this date (YYYY-MM-DD)')
+    li.add_argument('--desc', action='store_true', help='newest first')
+    li.set_defaults(func=cmd_list)
+
+    s = sub.add_parser('summary', help='averages, mood counts and period days')
+    s.add_argument('--streaks', action='store_true', help='include goal streaks')
+    span = s.add_mutually_exclusive_group()
+    span.add_argument('--week', action='store_true', help='only the last 7 days')
+    span.add_argument('--month', type=_month_arg, default=None, help='only this month (YYYY-MM)')
+    span.add_argument('--start', type=_date_arg, default=None, help='only from this date (YYYY-MM-DD) ...')
+    s.add_argument('--end', type=_date_arg, default=None, help='... up to this date (default: today)')
+    s.set_defaults(func=cmd_summary)
+
+    e = sub.add_parser('export', help='write all valid entries as CSV, JSON lines, Parquet or Arrow')
+    e.add_argument('--format', choices=['csv', 'json', 'parquet', 'arrow'], default='csv')
+    e.add_argument('--out', default=None, help='output file, or directory for parquet/arrow (default: stdout)')
+    e.add_argument('--partition', choices=['year', 'month'], default='year',
+                   help='parquet/arrow: one file per year or month')
+    e.add_argument('--all-users', action='store_true', help='parquet/arrow: every user shard, with a user column')
+    e.add_argument('--overwrite', action='store_true', help='replace an existing --out directory')
+    e.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('period-days', help='list the days marked as period days')
+    p.set_defaults(func=cmd_period_days)
+
+    c = sub.add_parser('calendar', help='month view with period days marked')
+    c.add_argument('--month', type=_month_arg, default=None, help='YYYY-MM (default: this month)')
+    c.set_defaults(func=cmd_calendar)
+
+    pl = sub.add_parser('plot', help='show a chart (needs matplotlib)')
+    pl.add_argument('chart', choices=['weekly', 'streaks'])
+    pl.add_argument('--out', default=None, help='write a .png or .svg file instead of opening a window')
+    pl.set_defaults(func=cmd_plot)
+    return parser
+
+
+def main(argv=None):
+    metrics.dump_at_exit()
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except BrokenPipeError:  # e.g. piped into head
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# columnar.py
+"""Parquet / Arrow IPC export of the full entry history, and a range reader.
+
+    python tracker.py export --format parquet --out entries_parquet
+    python tracker.py --storage sqlite export --format arrow --out entries_arrow --all-users
+
+An export is a directory partitioned by date (``year=2025/part-0.parquet``,
+or ``user=alice/year=2025/...`` for all users) plus ``_manifest.json``,
+which lists every row group with its row count and first/last date.
+Parquet files carry the usual per-row-group column statistics as well.
+Rows are streamed from the store in date order into one open file at a
+time, buffering at most one row group, so memory stays bounded however
+long the history is. Rows that come back to a partition already closed
+(a CSV edited out of order) go to its next ``part-N`` file.
+
+read_range() uses the manifest to open only the row groups that overlap a
+date range. Needs pyarrow (``pip install pyarrow``).
+"""
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+
+from metrics import timed
+from records import MOODS, iter_entries
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+ROW_GROUP_SIZE = 64 * 1024
+MANIFEST = "_manifest.json"
+MOOD_CODES = {m: i for i, m in enumerate(MOODS)}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Parquet/Arrow export needs pyarrow: pip install pyarrow")
+
+
+def entry_schema(with_user=False):
+    _require_pyarrow()
+    fields = [
+        ("date", pa.date32()),
+        ("sleep", pa.float32()),
+        ("mood", pa.dictionary(pa.int8(), pa.string())),
+        ("water_intake", pa.float32()),
+        ("period", pa.bool_()),
+        ("notes", pa.string()),
+    ]
+    if with_user:
+        fields.insert(0, ("user", pa.string()))
+    return pa.schema(fields)
+
+
+def _partition_of(day, by):
+    return f"year={day.year}" if by == "year" else f"month={day.year}-{day.month:02d}"
+
+
+class _PartitionWriter:
+    """One output file; each flush() becomes a row group (or IPC batch)."""
+
+    def __init__(self, root, rel_dir, fmt, schema, user=None, index=0):
+        self.rel_path = os.path.join(rel_dir, f"part-{index}" + FORMATS[fmt])
+        path = os.path.join(root, self.rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.fmt = fmt
+        self.schema = schema
+        self.user = user
+        self.buffer = []
+        self.groups = []
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(path, schema, write_statistics=True)
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = ipc.new_file(self._sink, schema)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.buffer.sort(key=lambda e: e.date)
+        cols = {
+            "date": [e.date for e in self.buffer],
+            "sleep": [e.sleep for e in self.buffer],
+            # one fixed dictionary: an Arrow IPC file can't replace it between batches
+            "mood": pa.DictionaryArray.from_arrays(
+                pa.array([MOOD_CODES.get(e.mood) for e in self.buffer], pa.int8()), pa.array(MOODS)),
+            "water_intake": [e.water for e in self.buffer],
+            "period": [e.period for e in self.buffer],
+            "notes": [e.notes for e in self.buffer],
+        }
+        if self.user is not None:
+            cols["user"] = [self.user] * len(self.buffer)
+        batch = pa.RecordBatch.from_pydict(cols, schema=self.schema)
+        if self.fmt == "parquet":
+            self._writer.write_batch(batch, row_group_size=len(self.buffer))
+        else:
+            self._writer.write_batch(batch)
+        self.groups.append({"rows": len(self.buffer), "min": self.buffer[0].date.isoformat(),
+                            "max": self.buffer[-1].date.isoformat()})
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        if self.fmt != "parquet":
+            self._sink.close()
+
+
+def _write_store(store, root, fmt, by, row_group_size, schema, user=None, prefix=""):
+    parts = {}  # partition -> files written for it so far
+    done = []
+    part, w = None, None
+    try:
+        for e in iter_entries(store):
+            if _partition_of(e.date, by) != part:
+                if w is not None:
+                    w, closing = None, w
+                    closing.close()
+                part = _partition_of(e.date, by)
+                index = parts[part] = parts.get(part, -1) + 1
+                w = _PartitionWriter(root, os.path.join(prefix, part), fmt, schema, user, index)
+                done.append((part, index, w))
+            w.buffer.append(e)
+            if len(w.buffer) >= row_group_size:
+                w.flush()
+    finally:
+        if w is not None:
+            w.close()
+    return [{"path": w.rel_path, "row_groups": w.groups} for _, _, w in sorted(done, key=lambda d: d[:2])]
+
+
+@timed("columnar.export")
+def export_entries(out_dir, store=None, shards=None, fmt="parquet", partition="year",
+                   row_group_size=ROW_GROUP_SIZE, overwrite=False):
+    """Write the history of ``store`` (or of every (user, store) in ``shards``).
+
+    The export is built in a temp directory next to ``out_dir`` and moved
+    into place at the end. Returns the number of rows written.
+    """
+    _require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt!r}")
+    if os.path.exists(out_dir) and not overwrite:
+        raise FileExistsError(f"{out_dir} already exists")
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(out_dir) + ".", dir=parent)
+    try:
+        files = []
+        if shards is None:
+            files += _write_store(store, tmp, fmt, partition, row_group_size, entry_schema())
+        else:
+            schema = entry_schema(with_user=True)
+            for user_id, user_store in shards:
+                files += _write_store(user_store, tmp, fmt, partition, row_group_size, schema,
+                                      user=user_id, prefix=f"user={user_id}")
+        manifest = {"format": fmt, "partition": partition, "users": shards is not None, "files": files}
+        with open(os.path.join(tmp, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=1)
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.replace(tmp, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return sum(g["rows"] for f in files for g in f["row_groups"])
+
+
+def read_manifest(root):
+    with open(os.path.join(root, MANIFEST), "r") as f:
+        return json.load(f)
+
+
+def iter_range(root, start=None, end=None, columns=None):
+    """Yield a Table per row group with ``start <= date <= end`` (ISO strings or dates).
+
+    Row groups whose first/last dates fall outside the range are never read,
+    so memory stays at one row group at a time.
+    """
+    _require_pyarrow()
+    start = date.fromisoformat(str(start)) if start else None
+    end = date.fromisoformat(str(end)) if end else None
+    manifest = read_manifest(root)
+    read_cols = None if columns is None else sorted(set(columns) | {"date"})
+    for f in manifest["files"]:
+        wanted = [i for i, g in enumerate(f["row_groups"])
+                  if (start is None or g["max"] >= start.isoformat())
+                  and (end is None or g["min"] <= end.isoformat())]
+        if not wanted:
+            continue
+        path = os.path.join(root, f["path"])
+        if manifest["format"] == "parquet":
+            pf = pq.ParquetFile(path)
+            groups = (pf.read_row_group(i, columns=read_cols) for i in wanted)
+        else:
+            reader = ipc.open_file(pa.memory_map(path, "r"))
+            groups = (pa.Table.from_batches([reader.get_batch(i)]) for i in wanted)
+        for table in groups:
+            mask = None
+            if start is not None:
+                mask = pc.greater_equal(table["date"], pa.scalar(start, pa.date32()))
+            if end is not None:
+                upper = pc.less_equal(table["date"], pa.scalar(end, pa.date32()))
+                mask = upper if mask is None else pc.and_(mask, upper)
+            if mask is not None:
+                table = table.filter(mask)
+            if columns is not None:
+                table = table.select(columns)
+            if table.num_rows:
+                yield table
+
+
+def read_range(root, start=None, end=None, columns=None):
+    """All rows in the date range as one pyarrow Table."""
+    tables = list(iter_range(root, start, end, columns))
+    if not tables:
+        schema = entry_schema(with_user=read_manifest(root)["users"])
+        if columns is not None:
+            schema = pa.schema([schema.field(c) for c in columns])
+        return schema.empty_table()
+    return pa.concat_tables(tables)
@@ -0,0 +1,212 @@
+# cycles.py
+import bisect
+import math
+import threading
+from datetime import date, timedelta
+
+from metrics import timed
+from storage import one_write_apart
+
+# Gaps between period starts outside this range are treated as missing data
+# (a skipped month of logging, a one-off spotting day), not as cycles.
+MIN_CYCLE = 15
+MAX_CYCLE = 60
+DEFAULT_CYCLE = 28
+DEFAULT_PERIOD_LENGTH = 5
+
+
+def _day(val):
+    try:
+        return date.fromisoformat(str(val).strip()).toordinal()
+    except ValueError:
+        return None
+
+
+def _is_period(row):
+    return row is not None and len(row) >= 5 and str(row[4]).strip().lower() == "yes"
+
+
+class CycleIndex:
+    """Period start dates and running cycle-length statistics.
+
+    Days are kept as ordinals. A start is a period day whose previous day
+    isn't one; the cycle lengths are the gaps between consecutive starts. A
+    toggled day can only change the starts next to it, so add_day() and
+    remove_day() touch a couple of gaps and the mean/variance sums instead of
+    regrouping the whole history.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.days = set()
+        self.starts = []  # sorted ordinals
+        self.cycles = 0  # gaps counted in the sums below
+        self.total = 0
+        self.total_sq = 0
+
+    def rebuild(self, rows, version):
+        self.__init__()
+        for r in rows:
+            if _is_period(r):
+                d = _day(r[0])
+                if d is not None:
+                    self.days.add(d)
+        self.starts = sorted(d for d in self.days if d - 1 not in self.days)
+        for a, b in zip(self.starts, self.starts[1:]):
+            self._count(b - a, 1)
+        self.version = version
+
+    def _count(self, gap, sign):
+        if MIN_CYCLE <= gap <= MAX_CYCLE:
+            self.cycles += sign
+            self.total += sign * gap
+            self.total_sq += sign * gap * gap
+
+    def _add_start(self, s):
+        i = bisect.bisect_left(self.starts, s)
+        prev = self.starts[i - 1] if i > 0 else None
+        nxt = self.starts[i] if i < len(self.starts) else None
+        if prev is not None and nxt is not None:
+            self._count(nxt - prev, -1)
+        if prev is not None:
+            self._count(s - prev, 1)
+        if nxt is not None:
+            self._count(nxt - s, 1)
+        self.starts.insert(i, s)
+
+    def _remove_start(self, s):
+        i = bisect.bisect_left(self.starts, s)
+        if i >= len(self.starts) or self.starts[i] != s:
+            return
+        del self.starts[i]
+        prev = self.starts[i - 1] if i > 0 else None
+        nxt = self.starts[i] if i < len(self.starts) else None
+        if prev is not None:
+            self._count(s - prev, -1)
+        if nxt is not None:
+            self._count(nxt - s, -1)
+        if prev is not None and nxt is not None:
+            self._count(nxt - prev, 1)
+
+    def add_day(self, d):
+        if d in self.days:
+            return
+        self.days.add(d)
+        if d + 1 in self.days:
+            self._remove_start(d + 1)
+        if d - 1 not in self.days:
+            self._add_start(d)
+
+    def remove_day(self, d):
+        if d not in self.days:
+            return
+        self.days.discard(d)
+        if d - 1 not in self.days:
+            self._remove_start(d)
+        if d + 1 in self.days:
+            self._add_start(d + 1)
+
+    def apply(self, old, new):
+        """Update for one saved/deleted row (either may be None)."""
+        if _is_period(old) and not (_is_period(new) and new[0] == old[0]):
+            d = _day(old[0])
+            if d is not None:
+                self.remove_day(d)
+        if _is_period(new):
+            d = _day(new[0])
+            if d is not None:
+                self.add_day(d)
+
+    def mean(self):
+        return self.total / self.cycles if self.cycles else None
+
+    def variance(self):
+        if self.cycles < 2:
+            return None
+        m = self.total / self.cycles
+        return max(0.0, (self.total_sq - self.cycles * m * m) / (self.cycles - 1))
+
+    def period_length(self):
+        return len(self.days) / len(self.starts) if self.starts else None
+
+    def predict(self, default_cycle=DEFAULT_CYCLE, count=3, after=None):
+        """The next ``count`` predicted periods ending on or after ``after``.
+
+        Each is (first day, last day, earliest start, latest start) as dates;
+        the earliest/latest spread is one standard deviation of the cycle
+        length (at least a day). The profile's cycle length is used until two
+        starts are known. None with no period logged.
+        """
+        if not self.starts:
+            return None
+        cycle = self.mean() or float(default_cycle or DEFAULT_CYCLE)
+        var = self.variance()
+        spread = max(1, round(math.sqrt(var))) if var is not None else 2
+        length = max(1, round(self.period_length() or DEFAULT_PERIOD_LENGTH))
+        after = (after or date.today()).toordinal()
+        # skip cycles that are already over if logging stopped a while ago
+        first = max(1, math.ceil((after - (length - 1) - self.starts[-1]) / cycle))
+        out = []
+        for i in range(first, first + count):
+            start = self.starts[-1] + round(cycle * i)
+            out.append((date.fromordinal(start), date.fromordinal(start + length - 1),
+                        date.fromordinal(start - spread), date.fromordinal(start + spread)))
+        return out
+
+    def summary(self, default_cycle=DEFAULT_CYCLE):
+        var = self.variance()
+        return {
+            "periods": len(self.starts),
+            "last_start": date.fromordinal(self.starts[-1]) if self.starts else None,
+            "cycles": self.cycles,
+            "mean_cycle": self.mean(),
+            "std_cycle": math.sqrt(var) if var is not None else None,
+            "period_length": self.period_length(),
+            "predictions": self.predict(default_cycle) or [],
+        }
+
+
+def predicted_days(predictions, year, month):
+    """Days of ``month`` inside a predicted period (first to last day)."""
+    days = set()
+    for first, last, _, _ in predictions or []:
+        d = first
+        while d <= last:
+            if d.year == year and d.month == month:
+                days.add(d.day)
+            d += timedelta(days=1)
+    return days
+
+
+_index = {}
+_lock = threading.Lock()
+
+
+@timed("cycles.cycles_for")
+def cycles_for(store):
+    """The up-to-date CycleIndex for ``store``, rebuilding only if out of sync."""
+    with _lock:
+        idx = _index.setdefault(store.cache_key, CycleIndex())
+        version = store.version()
+        if idx.version is None or idx.version != version:
+            idx.rebuild(store.read_all(), version)
+        return idx
+
+
+def record_change(store, version_before, old, new):
+    """Apply one save/delete made on ``store``; see aggregates.record_change."""
+    with _lock:
+        idx = _index.get(store.cache_key)
+        if idx is None or idx.version is None or idx.version != version_before:
+            return
+        after = store.version()
+        if not one_write_apart(version_before, after):
+            idx.version = None  # another save landed in between: rebuild
+            return
+        idx.apply(old, new)
+        idx.version = after
+
+
+def forget(store):
+    with _lock:
+        _index.pop(store.cache_key, None)
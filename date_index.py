@@ -0,0 +1,80 @@
+# date_index.py
+from bisect import bisect_left, bisect_right
+
+
+class DateIndex:
+    """Rows kept sorted by their ISO date (column 0), one row per date.
+
+    Lookups, inserts and deletes find their slot with a binary search, and a
+    date range is a slice between two bisections. When the source rows hold
+    the same date more than once the later row wins, like a save would.
+    """
+
+    def __init__(self, rows=()):
+        latest = {}
+        for r in rows:
+            if r:
+                latest[r[0]] = r
+        self._dates = sorted(latest)
+        self._rows = [latest[d] for d in self._dates]
+
+    def __len__(self):
+        return len(self._dates)
+
+    def __contains__(self, day):
+        return self._find(day) is not None
+
+    def _find(self, day):
+        i = bisect_left(self._dates, day)
+        if i < len(self._dates) and self._dates[i] == day:
+            return i
+        return None
+
+    def get(self, day):
+        i = self._find(day)
+        return None if i is None else self._rows[i]
+
+    def upsert(self, row):
+        day = row[0]
+        i = bisect_left(self._dates, day)
+        if i < len(self._dates) and self._dates[i] == day:
+            self._rows[i] = row
+        else:
+            self._dates.insert(i, day)
+            self._rows.insert(i, row)
+
+    def delete(self, day):
+        i = self._find(day)
+        if i is None:
+            return False
+        del self._dates[i]
+        del self._rows[i]
+        return True
+
+    def _span(self, start, end):
+        lo = 0 if start is None else bisect_left(self._dates, start)
+        hi = len(self._dates) if end is None else bisect_right(self._dates, end)
+        return lo, max(lo, hi)
+
+    def range(self, start, end):
+        """Rows with ``start <= date <= end``, oldest first."""
+        lo, hi = self._span(start, end)
+        return self._rows[lo:hi]
+
+    def count(self, start=None, end=None):
+        lo, hi = self._span(start, end)
+        return hi - lo
+
+    def page(self, offset, limit, start=None, end=None, newest_first=False):
+        """``limit`` rows from ``offset`` within the range, sliced straight from the index."""
+        lo, hi = self._span(start, end)
+        if newest_first:
+            top = hi - offset
+            return self._rows[max(lo, top - limit):max(lo, top)][::-1]
+        return self._rows[min(hi, lo + offset):min(hi, lo + offset + limit)]
+
+    def dates(self):
+        return list(self._dates)
+
+    def rows(self):
+        return list(self._rows)
@@ -0,0 +1,99 @@
+# frames.py
+import threading
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+from records import MOODS
+from storage import HEADER
+
+MOOD_DTYPE = pd.CategoricalDtype(MOODS)
+CHUNK_ROWS = 64 * 1024  # rows parsed at a time, so their strings never pile up
+
+
+def _numbers(col):
+    # blank -> NaN; anything else must be a non-negative number
+    text = col.str.strip()
+    blank = text == ''
+    num = pd.to_numeric(text.where(~blank), errors='coerce')
+    bad = ~blank & (num.isna() | (num < 0))
+    return num.astype(np.float32), bad
+
+
+def rows_to_frame(rows):
+    """Typed, date-sorted DataFrame of the rows that records.parse_row accepts.
+
+    Columns: date (datetime64), sleep and water (float32, NaN when not
+    logged), mood (categorical over MOODS), period (bool), notes (string).
+    ``rows`` may be any iterable; it is parsed CHUNK_ROWS at a time.
+    """
+    rows = iter(rows)
+    parts = []
+    while True:
+        chunk = list(islice(rows, CHUNK_ROWS))
+        parts.append(_typed([r for r in chunk if len(r) == len(HEADER)]))
+        if len(chunk) < CHUNK_ROWS:
+            break
+    frame = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    return frame.sort_values('date', kind='stable').reset_index(drop=True)
+
+
+def _typed(rows):
+    raw = pd.DataFrame(rows, columns=HEADER, dtype=object)
+    day = pd.to_datetime(raw['date'].str.strip(), format='%Y-%m-%d', errors='coerce')
+    sleep, bad_sleep = _numbers(raw['sleep'])
+    water, bad_water = _numbers(raw['water_intake'])
+    mood = raw['mood'].str.strip().str.capitalize()
+    bad_mood = (mood != '') & ~mood.isin(MOODS)
+    period = raw['period'].str.strip().str.lower()
+    ok = day.notna() & ~bad_sleep & ~bad_water & ~bad_mood & period.isin(['yes', 'no'])
+
+    frame = pd.DataFrame({
+        'date': day[ok],
+        'sleep': sleep[ok],
+        'water': water[ok],
+        'mood': mood[ok].where(mood[ok] != '').astype(MOOD_DTYPE),
+        'period': (period[ok] == 'yes').astype(bool),
+        'notes': raw['notes'][ok].astype('string'),
+    })
+    return frame.reset_index(drop=True)
+
+
+_frames = {}
+_lock = threading.Lock()
+
+
+@timed("frames.load_frame")
+def load_frame(store):
+    """The typed frame for ``store``, parsed once per store version.
+
+    Shared between callers, so treat it as read-only.
+    """
+    version = store.version()
+    with _lock:
+        hit = _frames.get(store.cache_key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+    # streamed, so the store's row cache isn't filled just to build this
+    frame = rows_to_frame(store.iter_rows())
+    with _lock:
+        _frames[store.cache_key] = (version, frame)
+    return frame
+
+
+def forget(store):
+    with _lock:
+        _frames.pop(store.cache_key, None)
+
+
+def frame_summary(frame):
+    """Same numbers as records.summarize(), from a frame."""
+    return {
+        'entries': len(frame),
+        'avg_sleep': float(frame['sleep'].mean()) if frame['sleep'].notna().any() else None,
+        'avg_water': float(frame['water'].mean()) if frame['water'].notna().any() else None,
+        'mood_counts': {m: int(n) for m, n in frame['mood'].value_counts(sort=False).items()},
+        'period_days': int(frame['period'].sum()),
+    }
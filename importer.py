@@ -0,0 +1,185 @@
+# importer.py
+"""Bulk import of historical entries from CSV or JSONL.
+
+    python importer.py history.csv
+    python importer.py export.jsonl --user alice --rejects bad_rows.csv
+
+The input is read in chunks and each chunk is validated in a worker process
+with the same rules as the forms (records.parse_row). Valid rows are saved
+by date in one batched write; later rows win when a date repeats, and
+existing entries for those dates are replaced. Rejected rows go to a CSV
+report with their line number and the reason.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from records import BadRow, parse_row
+from storage import HEADER, open_store
+
+CHUNK_SIZE = 5000
+# JSONL keys accepted for each column (the app's own names first)
+JSON_KEYS = [
+    ('date',),
+    ('sleep',),
+    ('mood',),
+    ('water_intake', 'water'),
+    ('period',),
+    ('notes',),
+]
+
+
+def _json_row(obj):
+    if not isinstance(obj, dict):
+        raise BadRow("expected a JSON object")
+    row = []
+    for names in JSON_KEYS:
+        val = next((obj[n] for n in names if n in obj), None)
+        if isinstance(val, bool):
+            val = 'yes' if val else 'no'
+        row.append('' if val is None else str(val))
+    return row
+
+
+def read_csv(f):
+    """Yield (line number, row) from a CSV file, skipping a header row."""
+    reader = csv.reader(f)
+    for row in reader:
+        if not row:
+            continue
+        if reader.line_num == 1 and row[0].strip().lower() == 'date':
+            continue
+        yield reader.line_num, row
+
+
+def read_jsonl(f):
+    """Yield (line number, row or raw text) from a JSON-lines file."""
+    for n, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield n, _json_row(json.loads(line))
+        except (ValueError, BadRow):
+            yield n, line  # rejected in validate_chunk
+
+
+def validate_chunk(chunk):
+    """Split [(line, row)] into (normalized rows, [(line, row, reason)]).
+
+    Runs in a worker process, so it only deals in plain lists and strings.
+    """
+    good, bad = [], []
+    for line, row in chunk:
+        if isinstance(row, str):
+            bad.append((line, [row], "not a JSON object"))
+            continue
+        try:
+            e = parse_row(row)
+        except BadRow as err:
+            bad.append((line, row, str(err)))
+            continue
+        good.append([e.date.isoformat(), row[1].strip(), e.mood or '', row[3].strip(),
+                     'yes' if e.period else 'no', row[5]])
+    return good, bad
+
+
+def _chunks(items, size):
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _validated(chunks, workers):
+    """validate_chunk() over ``chunks``, results in input order.
+
+    At most two chunks per worker are in flight, so memory stays bounded
+    however big the input is.
+    """
+    first = next(chunks, None)
+    if first is None:
+        return
+    second = next(chunks, None)
+    if workers <= 1 or second is None:
+        # not worth starting processes for
+        rest = [second] if second else []
+        for chunk in itertools.chain([first], rest, chunks):
+            yield validate_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = [pool.submit(validate_chunk, first), pool.submit(validate_chunk, second)]
+        for chunk in chunks:
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+            pending.append(pool.submit(validate_chunk, chunk))
+        for fut in pending:
+            yield fut.result()
+
+
+def import_entries(src, store=None, fmt=None, rejects_path=None, chunk_size=CHUNK_SIZE, workers=None):
+    """Import ``src`` into ``store``; returns (rows imported, rows rejected)."""
+    store = store or open_store()
+    fmt = fmt or ('jsonl' if src.endswith(('.jsonl', '.ndjson')) else 'csv')
+    rejects_path = rejects_path or os.path.splitext(src)[0] + '.rejects.csv'
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+
+    by_date = {}
+    rejected = 0
+    rejects = None
+    try:
+        with open(src, 'r', newline='', encoding='utf-8-sig') as f:
+            rows = read_jsonl(f) if fmt == 'jsonl' else read_csv(f)
+            for good, bad in _validated(_chunks(rows, chunk_size), workers):
+                for row in good:
+                    by_date[row[0]] = row
+                if bad:
+                    if rejects is None:
+                        rejects = open(rejects_path, 'w', newline='')
+                        writer = csv.writer(rejects)
+                        writer.writerow(['line', 'reason'] + HEADER)
+                    for line, row, reason in bad:
+                        writer.writerow([line, reason] + list(row))
+                    rejected += len(bad)
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+    if by_date:
+        store.upsert_many([by_date[d] for d in sorted(by_date)])
+    return len(by_date), rejected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import historical entries into the tracker")
+    parser.add_argument('src', help='CSV (same columns as tracker_data.csv) or JSONL file')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                        help='input format (default: from the file extension)')
+    parser.add_argument('--data', default=None, help='data file to import into (default: tracker_data.csv)')
+    parser.add_argument('--user', default=None, help='import into this user\'s shard instead')
+    parser.add_argument('--rejects', default=None, help='where to write rejected rows')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help='validation processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    if args.user:
+        import users
+        store = users.registry().get(args.user).store
+    else:
+        store = open_store(args.data) if args.data else open_store()
+    rejects_path = args.rejects or os.path.splitext(args.src)[0] + '.rejects.csv'
+    imported, rejected = import_entries(args.src, store, fmt=args.format, rejects_path=rejects_path,
+                                        chunk_size=args.chunk_size, workers=args.workers)
+    print(f"✅ Imported {imported:,} day(s)")
+    if rejected:
+        print(f"⚠️ Rejected {rejected:,} row(s); see {rejects_path}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# metrics.py
+import atexit
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# Off unless TRACKER_METRICS is set, in which case timed() wraps calls
+ENABLED = os.environ.get("TRACKER_METRICS", "").strip().lower() in ("1", "true", "yes", "on")
+METRICS_FILE = os.environ.get("TRACKER_METRICS_FILE", "tracker_metrics.json")
+MAX_SAMPLES = 2000  # per operation, for the percentiles
+
+_ops = {}
+_lock = threading.Lock()
+_dump_paths = set()  # registered by dump_at_exit()
+
+
+class _Op:
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=MAX_SAMPLES)
+
+
+def record(name, seconds):
+    with _lock:
+        op = _ops.get(name)
+        if op is None:
+            op = _ops[name] = _Op()
+        op.count += 1
+        op.total += seconds
+        op.max = max(op.max, seconds)
+        op.samples.append(seconds)
+
+
+class _Timer:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def timed(name):
+    """Time a block (``with timed("x"):``) or a function (``@timed("x")``).
+
+    With metrics off the decorator hands the function back untouched and the
+    context manager does nothing.
+    """
+    if not ENABLED:
+        return _TimedOff()
+    return _TimedOn(name)
+
+
+class _TimedOff:
+    def __call__(self, fn):
+        return fn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _TimedOn(_Timer):
+    def __call__(self, fn):
+        name = self.name
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+
+
+def _percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    # nearest-rank
+    k = max(0, math.ceil(pct / 100 * len(sorted_samples)) - 1)
+    return sorted_samples[k]
+
+
+def snapshot():
+    """{operation: {count, total, mean, p50, p95, p99, max}} in seconds."""
+    with _lock:
+        items = [(name, op.count, op.total, op.max, sorted(op.samples)) for name, op in _ops.items()]
+    out = {}
+    for name, count, total, worst, samples in sorted(items):
+        out[name] = {
+            "count": count,
+            "total": total,
+            "mean": total / count if count else 0.0,
+            "p50": _percentile(samples, 50),
+            "p95": _percentile(samples, 95),
+            "p99": _percentile(samples, 99),
+            "max": worst,
+        }
+    return out
+
+
+def reset():
+    with _lock:
+        _ops.clear()
+
+
+def dump(path=METRICS_FILE):
+    with open(path, "w") as f:
+        json.dump(snapshot(), f, indent=4)
+
+
+def dump_at_exit(path=METRICS_FILE):
+    """Write the metrics to ``path`` when the process exits (if enabled).
+
+    Safe to call from every entry point; each path is registered once.
+    """
+    if ENABLED and path not in _dump_paths:
+        _dump_paths.add(path)
+        atexit.register(dump, path)
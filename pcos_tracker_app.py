@@ -5,7 +5,17 @@ import os
 import json
 import calendar
 from datetime import date, datetime, timedelta
-from collections import Counter
+from storage import ANY, HEADER, ConflictError, open_store
+import aggregates
+import analytics
+import charts
+import cycles
+import frames
+import metrics
+import period
+import records
+import rolling
+import users
 
 # -----------------------
 # File names & config
@@ -19,25 +29,58 @@ st.set_page_config(page_title="Lifestyle Tracker", layout="wide")
 # -----------------------
 # Helpers: file & config
 # -----------------------
+# Multi-user deployments open the app as ?user=<id> (or set TRACKER_USER);
+# only that user's shard is loaded. Without one, the files above are used.
+USER_ID = st.query_params.get("user") or os.environ.get("TRACKER_USER")
+if USER_ID:
+    try:
+        shard = users.registry().get(USER_ID)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+    DATA_FILE, PROFILE_FILE, CONFIG_FILE = shard.data_path, shard.profile_path, shard.config_path
+    store = shard.store
+else:
+    store = open_store(DATA_FILE)
+
 def ensure_data_file():
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(['date','sleep','mood','water_intake','period','notes'])
+    store.ensure_file()
 
 def read_all_entries():
-    ensure_data_file()
-    with open(DATA_FILE, "r", newline="") as f:
-        rows = list(csv.reader(f))
-        if not rows:
-            return []
-        return rows[1:]  # skip header
+    return store.read_all()
 
 def write_all_entries(rows):
-    with open(DATA_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(['date','sleep','mood','water_intake','period','notes'])
-        writer.writerows(rows)
+    store.write_all(rows)
+    aggregates.forget(store)
+    cycles.forget(store)
+    rolling.forget(store)
+    period.forget_month(store)
+
+def save_entry(row, expected=ANY):
+    # In log mode this appends one record instead of rewriting the file.
+    # With ``expected`` set, raises ConflictError if another session changed
+    # the row since it was read.
+    before = store.version()
+    old = store.get(row[0])
+    store.upsert(row, expected=expected)
+    aggregates.record_change(store, before, old, row)
+    cycles.record_change(store, before, old, row)
+    rolling.record_change(store, before, old, row)
+    period.forget_month(store, row[0])
+
+def delete_entry(day, expected=ANY):
+    before = store.version()
+    old = store.get(day)
+    store.delete(day, expected=expected)
+    aggregates.record_change(store, before, old, None)
+    cycles.record_change(store, before, old, None)
+    rolling.record_change(store, before, old, None)
+    period.forget_month(store, day)
+
+def all_entries_csv():
+    df = frames.load_frame(store)
+    out = df.assign(date=df["date"].dt.strftime("%Y-%m-%d"), period=df["period"].map({True: "yes", False: "no"}))
+    return out.to_csv(index=False)
 
 def load_config():
     if os.path.exists(CONFIG_FILE):
@@ -84,21 +127,6 @@ def parse_float_safe(val, default=0.0):
     except Exception:
         return default
 
-def group_period_streaks(period_dates):
-    if not period_dates:
-        return []
-    dates = sorted([datetime.fromisoformat(d).date() for d in period_dates])
-    streaks = []
-    cur = [dates[0]]
-    for i in range(1, len(dates)):
-        if (dates[i] - dates[i-1]).days == 1:
-            cur.append(dates[i])
-        else:
-            streaks.append(cur)
-            cur = [dates[i]]
-    streaks.append(cur)
-    return streaks
-
 # -----------------------
 # UI: Profile / Dashboard
 # -----------------------
@@ -108,6 +136,10 @@ if "page" not in st.session_state:
     st.session_state.page = "dashboard"  # or "profile_setup" if no profile yet
 if "profile_edit_open" not in st.session_state:
     st.session_state.profile_edit_open = False
+# hidden diagnostics page: open the app with ?diagnostics in the URL
+if "diagnostics" in st.query_params and not st.session_state.get("diagnostics_opened"):
+    st.session_state.page = "diagnostics"
+    st.session_state.diagnostics_opened = True
 
 profile = load_profile()
 if profile is None:
@@ -121,7 +153,7 @@ st.write("")  # small spacer
 # Layout: left profile card (1/4), main area (3/4)
 main_col = st.container()
 
-with st.sidebar:
+with st.sidebar, metrics.timed("page.sidebar_profile"):
     # --- Start Profile Card (moved here) ---
     st.markdown("<div style='padding:8px;border-radius:10px;background:#ffe9e6'>", unsafe_allow_html=True)
     if profile:
@@ -130,18 +162,15 @@ with st.sidebar:
         cycle_len = profile.get("cycle_length", "")
         st.markdown(f"<h3 style='color:#b82b2b; margin:4px 0;'>👋 {name}</h3>", unsafe_allow_html=True)
         st.write(f"*Age:* {age}")
-        st.write(f"*Cycle length:* {cycle_len} days" if cycle_len else "*Cycle length:* -")
-        rows = read_all_entries()
-        total_entries = len(rows)
-        avg_sleep = None
-        avg_water = None
-        if total_entries:
-            sleeps = [parse_float_safe(r[1]) for r in rows if r[1] != ""]
-            waters = [parse_float_safe(r[3]) for r in rows if r[3] != ""]
-            if sleeps:
-                avg_sleep = sum(sleeps)/len(sleeps)
-            if waters:
-                avg_water = sum(waters)/len(waters)
+        learned = cycles.cycles_for(store).mean()
+        if learned is not None:
+            st.write(f"*Cycle length:* {learned:.0f} days (from your log)")
+        else:
+            st.write(f"*Cycle length:* {cycle_len} days" if cycle_len else "*Cycle length:* -")
+        stats = aggregates.stats_for(store).summary()
+        total_entries = stats["total_entries"]
+        avg_sleep = stats["avg_sleep"]
+        avg_water = stats["avg_water"]
         st.write(f"*Total entries:* {total_entries}")
         st.write(f"*Avg sleep:* {avg_sleep:.1f} hrs" if avg_sleep is not None else "*Avg sleep:* -")
         st.write(f"*Avg water:* {avg_water:.1f} L" if avg_water is not None else "*Avg water:* -")
@@ -158,7 +187,7 @@ with st.sidebar:
     st.markdown("</div>", unsafe_allow_html=True)
     # --- End Profile Card ---
 
-with main_col:
+with main_col, metrics.timed(f"page.{st.session_state.page}"):
     # PROFILE SETUP / EDIT
     if st.session_state.page == "profile_setup":
         st.header("👤 Profile Setup")
@@ -205,25 +234,35 @@ with main_col:
 
         st.markdown("---")
         st.subheader("Quick Stats")
-        rows = read_all_entries()
-        if not rows:
+        # materialized 7/30/90-day views: reading them doesn't touch the rows
+        views = rolling.views_for(store, config.get("sleep_goal", 7), config.get("water_goal", 2))
+        if views.last_entry is None:
             st.info("No entries yet — add your first entry.")
         else:
-            last = rows[-7:]
-            sleeps = [parse_float_safe(r[1]) for r in last if r[1] != ""]
-            waters = [parse_float_safe(r[3]) for r in last if r[3] != ""]
-            moods = [r[2] for r in last]
-            st.write(f"- Entries (last 7): {len(last)}")
-            if sleeps:
-                st.write(f"- Avg sleep (last 7): {sum(sleeps)/len(sleeps):.1f} hrs")
-            if waters:
-                st.write(f"- Avg water (last 7): {sum(waters)/len(waters):.1f} L")
-            mood_counts = Counter(moods)
+            table = [["", "Entries", "Avg sleep", "Avg water", "Goals met", "Period days"]]
+            for w in rolling.WINDOWS:
+                v = views.window(w)
+                table.append([f"Last {w} days", str(v["entries"]),
+                              f"{v['avg_sleep']:.1f} hrs" if v["avg_sleep"] is not None else "-",
+                              f"{v['avg_water']:.1f} L" if v["avg_water"] is not None else "-",
+                              f"{v['goal_hit_ratio']:.0%}" if v["goal_hit_ratio"] is not None else "-",
+                              str(v["period_days"])])
+            st.table(table)
+            mood_counts = views.window(7)["mood_counts"]
             col1, col2, col3 = st.columns(3)
             col1.metric("😊 Happy", mood_counts.get("Happy", 0))
             col2.metric("😐 Neutral", mood_counts.get("Neutral", 0))
             col3.metric("😞 Low", mood_counts.get("Low", 0))
 
+        cycle = cycles.cycles_for(store).summary((profile or {}).get("cycle_length"))
+        if cycle["predictions"]:
+            first, last, earliest, latest = cycle["predictions"][0]
+            st.subheader("Next Period")
+            st.write(f"- Expected: {first:%b %d} – {last:%b %d} (could start {earliest:%b %d} – {latest:%b %d})")
+            if cycle["mean_cycle"] is not None:
+                std = f" ± {cycle['std_cycle']:.1f}" if cycle["std_cycle"] is not None else ""
+                st.write(f"- Average cycle: {cycle['mean_cycle']:.1f}{std} days over {cycle['cycles']} cycle(s)")
+
     # -------- Page: ADD ENTRY ----------
     elif st.session_state.page == "add_entry":
         st.header("➕ Add Daily Entry")
@@ -237,39 +276,73 @@ with main_col:
             notes = st.text_area("Notes (optional)")
             submit = st.form_submit_button("Submit Entry")
         if submit:
-            rows = read_all_entries()
-            rows = [r for r in rows if r[0] != today_iso]
-            rows.append([today_iso, sleep, mood.split()[1], water, period_val, notes])
-            write_all_entries(rows)
+            save_entry([today_iso, sleep, mood.split()[1], water, period_val, notes])
             st.success("Entry saved.")
             st.session_state.page = "dashboard"
 
     # -------- Page: VIEW ALL ----------
     elif st.session_state.page == "view_all":
         st.header("📖 All Entries")
-        rows = read_all_entries()
-        if not rows:
-            st.info("No entries yet.")
+        # Only the page on screen is read (through the store's date index)
+        # and sent to the browser
+        c1, c2, c3 = st.columns([2, 1, 1])
+        filtered = c1.checkbox("Only a date range")
+        start = end = None
+        if filtered:
+            picked = c1.date_input("Date range", value=(date.today() - timedelta(days=29), date.today()))
+            if picked:
+                start, end = picked[0].isoformat(), picked[-1].isoformat()
+        newest_first = c2.radio("Sort", ["Newest first", "Oldest first"]) == "Newest first"
+        limit = c3.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+        total = store.count(start, end)
+        if not total:
+            st.info("No entries yet." if not filtered else "No entries in this range.")
         else:
-            st.table([['date','sleep','mood','water_intake','period','notes']] + rows)
+            pages = -(-total // limit)
+            # keyed on the view, so a new filter or sort starts back on page 1
+            page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1,
+                                   key=f"view_page:{start}:{end}:{newest_first}:{limit}")
+            offset = (int(page) - 1) * limit
+            rows = store.page(offset, limit, start, end, newest_first)
+            st.dataframe([dict(zip(HEADER, r)) for r in rows], hide_index=True)
+            st.caption(f"Rows {offset + 1}–{offset + len(rows)} of {total} · page {int(page)} of {pages}")
 
     # -------- Page: WEEKLY SUMMARY ----------
     elif st.session_state.page == "weekly_summary":
-        st.header("📊 Weekly Summary (last 7 entries)")
-        rows = read_all_entries()
-        if not rows:
-            st.info("No data.")
+        st.header("📊 Summary")
+        span = st.radio("Period", [f"Last {w} days" for w in rolling.WINDOWS] + ["This week", "Month", "Custom range"],
+                        horizontal=True)
+        today = date.today()
+        summary = None
+        if span.startswith("Last "):
+            views = rolling.views_for(store, config.get("sleep_goal", 7), config.get("water_goal", 2))
+            summary = views.window(int(span.split()[1]), today)
+            start, end = summary["start"], summary["end"]
+        elif span == "This week":
+            start, end = records.week_of(today)
+        elif span == "Month":
+            picked = st.date_input("Any day in the month", value=today)
+            start, end = records.month_of(picked.year, picked.month)
+        else:
+            picked = st.date_input("Date range", value=(today - timedelta(days=29), today))
+            start, end = (picked[0], picked[-1]) if picked else (today, today)
+        st.caption(f"{start:%b %d, %Y} – {end:%b %d, %Y}")
+        if summary is None:
+            # only the rows dated inside the range are read
+            summary = records.range_summary(start, end, store=store)
+        if not summary["entries"]:
+            st.info("No entries in this period.")
         else:
-            last7 = rows[-7:]
-            valid = [(parse_float_safe(r[1]), parse_float_safe(r[3]), r[2], r[4]) for r in last7]
-            if not valid:
+            if summary["avg_sleep"] is None and summary["avg_water"] is None:
                 st.info("No numeric data.")
             else:
-                sleep_avg = sum(v[0] for v in valid)/len(valid)
-                water_avg = sum(v[1] for v in valid)/len(valid)
-                mood_counts = Counter(v[2] for v in valid)
-                st.write(f"*Average sleep:* {sleep_avg:.1f} hrs")
-                st.write(f"*Average water:* {water_avg:.1f} L")
+                mood_counts = summary["mood_counts"]
+                st.write(f"*Entries:* {summary['entries']}")
+                st.write(f"*Average sleep:* {summary['avg_sleep'] or 0:.1f} hrs")
+                st.write(f"*Average water:* {summary['avg_water'] or 0:.1f} L")
+                st.write(f"*Period days:* {summary['period_days']}")
+                if summary.get("goal_hit_ratio") is not None:
+                    st.write(f"*Both goals met:* {summary['goal_hit_ratio']:.0%} of {summary['goal_days']} day(s)")
                 st.write("*Mood counts:*")
                 st.table([["😊 Happy", mood_counts.get("Happy",0)],
                           ["😐 Neutral", mood_counts.get("Neutral",0)],
@@ -278,13 +351,17 @@ with main_col:
     # -------- Page: EDIT/DELETE ----------
     elif st.session_state.page == "edit_delete":
         st.header("✏ Edit/Delete Entry")
-        rows = read_all_entries()
-        if not rows:
+        dates = store.dates()
+        if not dates:
             st.info("No entries.")
         else:
-            dates = [r[0] for r in rows]
             sel = st.selectbox("Select date", dates)
-            row = next((r for r in rows if r[0]==sel), None)
+            # Keep the row as first shown, so a save can tell whether another
+            # session changed it in the meantime
+            loaded = st.session_state.get("edit_loaded")
+            if not loaded or loaded[0] != sel:
+                loaded = st.session_state.edit_loaded = (sel, store.get(sel))
+            row = loaded[1]
             if row:
                 new_sleep = st.number_input("Sleep (hrs)", value=parse_float_safe(row[1]), step=0.5)
                 new_mood = st.selectbox("Mood", ["Happy","Neutral","Low"], index=["Happy","Neutral","Low"].index(row[2]) if row[2] in ["Happy","Neutral","Low"] else 1)
@@ -294,27 +371,29 @@ with main_col:
                 c1, c2 = st.columns(2)
                 with c1:
                     if st.button("Save changes"):
-                        for i in range(len(rows)):
-                            if rows[i][0] == sel:
-                                rows[i] = [sel, new_sleep, new_mood, new_water, new_period, new_notes]
-                                break
-                        write_all_entries(rows)
-                        st.success("Updated.")
+                        new_row = [sel, new_sleep, new_mood, new_water, new_period, new_notes]
+                        try:
+                            save_entry(new_row, expected=row)
+                            st.session_state.edit_loaded = (sel, store.get(sel))
+                            st.success("Updated.")
+                        except ConflictError:
+                            st.session_state.edit_loaded = None
+                            st.warning("This entry was changed in another session. Reload it and try again.")
                 with c2:
                     if st.button("Delete entry"):
-                        rows = [r for r in rows if r[0] != sel]
-                        write_all_entries(rows)
-                        st.warning("Deleted.")
+                        try:
+                            delete_entry(sel, expected=row)
+                            st.session_state.edit_loaded = None
+                            st.warning("Deleted.")
+                        except ConflictError:
+                            st.session_state.edit_loaded = None
+                            st.warning("This entry was changed in another session. Reload it and try again.")
 
     # -------- Page: PERIOD CALENDAR ----------
    # -------- Page: PERIOD CALENDAR ----------
     elif st.session_state.page == "period_calendar":
         st.header("📅 Period Calendar")
 
-        rows = read_all_entries()
-        period_days = {r[0] for r in rows if len(r) >= 5 and r[4].strip().lower() == "yes"}
-        streaks = group_period_streaks(period_days)
-
         today = date.today()
         years = list(range(2020, today.year + 3))
         c1, c2 = st.columns([2, 1])
@@ -325,6 +404,10 @@ with main_col:
 
         month = list(calendar.month_name).index(sel_month)
         year = sel_year
+        status = period.month_status(store, year, month)
+        predictions = cycles.cycles_for(store).predict((profile or {}).get("cycle_length") or cycles.DEFAULT_CYCLE,
+                                                       after=date(year, month, 1))
+        predicted = cycles.predicted_days(predictions, year, month)
 
         # Make sure Monday is the first day (matches week_days order)
         calendar.setfirstweekday(calendar.MONDAY)
@@ -351,9 +434,9 @@ with main_col:
                     )
                 else:
                     day_str = f"{year}-{month:02d}-{day:02d}"
-                    is_today = day_str == today.isoformat()
-                    is_period = day_str in period_days
-                    in_streak = any(datetime.fromisoformat(day_str).date() in s for s in streaks)
+                    is_today = status[day] & period.TODAY
+                    is_period = status[day] & period.PERIOD
+                    in_streak = status[day] & period.IN_STREAK
 
                     label = f"{day}"
                     if is_today:
@@ -362,54 +445,54 @@ with main_col:
                         label += "🩸 "
                     elif in_streak:
                         label += "◻️ "
+                    elif day in predicted:
+                        label += "🔮"
 
                     if cols[i].button(label, key=f"pcal_{day_str}"):
-                        # toggle
-                        if day_str in period_days:
-                            for r in rows:
-                                if r[0] == day_str:
-                                    r[4] = "no"
-                                    break
-                            period_days.discard(day_str)
-                        else:
-                            found = False
-                            for r in rows:
-                                if r[0] == day_str:
-                                    r[4] = "yes"
-                                    found = True
-                                    break
-                            if not found:
-                                rows.append([day_str, "", "", "", "yes", ""])
-                            period_days.add(day_str)
-                        write_all_entries(rows)
+                        # toggle; re-read and retry if another session saved
+                        # the same day in between
+                        for _ in range(3):
+                            current = store.get(day_str)
+                            if is_period:
+                                row = list(current or [day_str, "", "", "", "", ""])
+                                row[4] = "no"
+                            elif current is not None:
+                                row = list(current)
+                                row[4] = "yes"
+                            else:
+                                row = [day_str, "", "", "", "yes", ""]
+                            try:
+                                save_entry(row, expected=current)
+                                break
+                            except ConflictError:
+                                continue
                         st.rerun()
+        if predicted:
+            st.caption("🔮 predicted period, based on your logged cycles")
 
     # -------- Page: STREAK CHART ----------
     elif st.session_state.page == "streak_chart":
         st.header("🏆 Streak Chart")
-        rows = read_all_entries()
-        if not rows:
+        cols = analytics.columns_for(store)  # binary store: straight from the mapped arrays
+        if not len(cols):
             st.info("No data.")
         else:
             sleep_goal = float(config.get("sleep_goal", 7))
             water_goal = float(config.get("water_goal", 2))
-            seq_sleep = [parse_float_safe(r[1]) >= sleep_goal for r in rows]
-            seq_water = [parse_float_safe(r[3]) >= water_goal for r in rows]
-
-            def calc(seq):
-                curr = 0; temp = 0; longest = 0
-                for v in seq:
-                    if v:
-                        temp += 1; longest = max(longest, temp)
-                    else:
-                        temp = 0
-                curr = temp
-                return curr, longest
-
-            sc, sl = calc(seq_sleep)
-            wc, wl = calc(seq_water)
+            sc, sl = analytics.goal_streaks(cols.sleep, sleep_goal)
+            wc, wl = analytics.goal_streaks(cols.water, water_goal)
             st.write(f"Sleep streak: *{sc}* (longest {sl}) — goal ≥ {sleep_goal:.1f} hrs")
             st.write(f"Water streak: *{wc}* (longest {wl}) — goal ≥ {water_goal:.1f} L")
+            views = rolling.views_for(store, sleep_goal, water_goal)
+            for w in rolling.WINDOWS:
+                v = views.window(w, views.last_entry)  # the days up to your latest entry
+                s_txt = f"{v['avg_sleep']:.1f} hrs" if v["avg_sleep"] is not None else "-"
+                w_txt = f"{v['avg_water']:.1f} L" if v["avg_water"] is not None else "-"
+                st.write(f"{w}-day average: sleep {s_txt}, water {w_txt}")
+            # drawn once per data/goals combination, then served from disk
+            chart = charts.render("streaks", store, {"sleep_goal": sleep_goal, "water_goal": water_goal})
+            if chart:
+                st.image(chart)
 
 
 
@@ -427,30 +510,22 @@ with main_col:
     # -------- Export Weekly Summary ----------
     elif st.session_state.page == "export":
         st.header("📁 Export Weekly Summary")
-        rows = read_all_entries()
-        if not rows:
+        if not store.count():
             st.info("No data.")
         else:
-            total_sleep = total_water = 0.0
-            mood_counts = Counter()
-            count = 0
-            for r in rows:
-                try:
-                    total_sleep += parse_float_safe(r[1])
-                    total_water += parse_float_safe(r[3])
-                    mood_counts[r[2]] += 1
-                    count += 1
-                except:
-                    continue
-            if count == 0:
+            summary = records.range_summary(*records.last_days(7), store=store)
+            if summary["avg_sleep"] is None and summary["avg_water"] is None:
                 st.info("No numeric data.")
             else:
                 import io
                 buf = io.StringIO()
                 writer = csv.writer(buf)
                 writer.writerow(['avg_sleep','avg_water','happy','neutral','low'])
-                writer.writerow([total_sleep/count, total_water/count, mood_counts.get('Happy',0), mood_counts.get('Neutral',0), mood_counts.get('Low',0)])
+                mood_counts = summary["mood_counts"]
+                writer.writerow([summary["avg_sleep"] or 0, summary["avg_water"] or 0, mood_counts.get('Happy',0), mood_counts.get('Neutral',0), mood_counts.get('Low',0)])
                 st.download_button("Download weekly_summary.csv", buf.getvalue(), file_name='weekly_summary.csv', mime='text/csv')
+            # built only when the button is clicked, not on every rerun
+            st.download_button("Download all entries (CSV)", all_entries_csv, file_name='entries.csv', mime='text/csv')
 
     # -------- Reset ----------
     elif st.session_state.page == "reset":
@@ -474,6 +549,27 @@ with main_col:
         - *Reset Tracker* clears all data (header preserved).
         """)
 
+    # -------- Diagnostics (hidden, ?diagnostics) ----------
+    elif st.session_state.page == "diagnostics":
+        st.header("🔧 Diagnostics")
+        if not metrics.ENABLED:
+            st.info("Timing is off. Start the app with TRACKER_METRICS=1 to collect it.")
+        snap = metrics.snapshot()
+        if not snap:
+            st.write("No timings recorded yet.")
+        else:
+            table = [["operation", "count", "total ms", "p50 ms", "p95 ms", "p99 ms", "max ms"]]
+            for name, m in snap.items():
+                table.append([name, str(m["count"])] + [f"{m[k] * 1000:.2f}" for k in ("total", "p50", "p95", "p99", "max")])
+            st.table(table)
+        c1, c2 = st.columns(2)
+        if c1.button("Reset metrics"):
+            metrics.reset()
+            st.rerun()
+        if c2.button("Save metrics file"):
+            metrics.dump()
+            st.success(f"Saved to {metrics.METRICS_FILE}")
+
 # -----------------------
 # Sidebar: less important actions (persistent)
 # -----------------------
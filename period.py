@@ -0,0 +1,95 @@
+# period.py
+import calendar
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+from metrics import timed
+
+# Bits in a month status bitmap, one byte per day (index 0 is unused)
+PERIOD = 1
+IN_STREAK = 2
+TODAY = 4
+
+MONTH_CACHE_SIZE = 24
+
+
+def group_period_streaks(period_dates):
+    if not period_dates:
+        return []
+    dates = sorted([datetime.fromisoformat(d).date() for d in period_dates])
+    streaks = []
+    cur = [dates[0]]
+    for i in range(1, len(dates)):
+        if (dates[i] - dates[i-1]).days == 1:
+            cur.append(dates[i])
+        else:
+            streaks.append(cur)
+            cur = [dates[i]]
+    streaks.append(cur)
+    return streaks
+
+
+def build_month_status(rows, year, month, today=None):
+    """Bitmap of PERIOD / IN_STREAK / TODAY flags for every day of a month.
+
+    ``rows`` only needs to cover the month itself: a streak is a run of
+    period days, so whether a day of this month is in one depends on this
+    month's period days alone.
+    """
+    today = today or date.today()
+    days = calendar.monthrange(year, month)[1]
+    status = bytearray(days + 1)
+    period_days = {r[0] for r in rows if len(r) >= 5 and r[4].strip().lower() == "yes"}
+    for streak in group_period_streaks(period_days):
+        for d in streak:
+            if d.year == year and d.month == month:
+                status[d.day] |= IN_STREAK
+    for d in period_days:
+        day = datetime.fromisoformat(d).date()
+        if day.year == year and day.month == month:
+            status[day.day] |= PERIOD
+    if today.year == year and today.month == month:
+        status[today.day] |= TODAY
+    return status
+
+
+_months = OrderedDict()  # (store key, year, month) -> (store version, today, bitmap)
+_lock = threading.Lock()
+
+
+@timed("calendar.month_status")
+def month_status(store, year, month):
+    """Cached status bitmap for one month of ``store``.
+
+    Rebuilt when the store changes under us, the date rolls over or the month
+    was dropped with forget_month().
+    """
+    key = (store.cache_key, year, month)
+    version = store.version()
+    today = date.today()
+    with _lock:
+        hit = _months.get(key)
+        if hit is not None and hit[0] == version and hit[1] == today:
+            _months.move_to_end(key)
+            return hit[2]
+    first = date(year, month, 1).isoformat()
+    last = date(year, month, calendar.monthrange(year, month)[1]).isoformat()
+    status = build_month_status(store.range(first, last), year, month, today)
+    with _lock:
+        _months[key] = (version, today, status)
+        _months.move_to_end(key)
+        while len(_months) > MONTH_CACHE_SIZE:
+            _months.popitem(last=False)
+    return status
+
+
+def forget_month(store, day=None):
+    """Drop the cached month containing ISO date ``day`` (all months if None)."""
+    with _lock:
+        if day is None:
+            for key in [k for k in _months if k[0] == store.cache_key]:
+                del _months[key]
+            return
+        d = datetime.fromisoformat(str(day)).date()
+        _months.pop((store.cache_key, d.year, d.month), None)
@@ -0,0 +1,230 @@
+# records.py
+import calendar
+import csv
+from collections import namedtuple
+from datetime import date, timedelta
+
+from metrics import timed
+from storage import HEADER, open_store
+
+MOODS = ['Happy', 'Neutral', 'Low']
+QUARANTINE_FILE = "tracker_data.quarantine.csv"
+
+# One parsed day. sleep/water/mood are None on rows created from the period
+# calendar, which only fills in the date and period status.
+Entry = namedtuple('Entry', ['date', 'sleep', 'mood', 'water', 'period', 'notes'])
+
+
+class BadRow(ValueError):
+    pass
+
+
+def _number(val, field):
+    val = val.strip()
+    if val == '':
+        return None
+    try:
+        num = float(val)
+    except ValueError:
+        raise BadRow(f"{field} is not a number: {val!r}")
+    if num < 0:
+        raise BadRow(f"{field} is negative: {val!r}")
+    return num
+
+
+def parse_row(row):
+    """Turn one CSV row into an Entry, or raise BadRow saying why not."""
+    if len(row) != len(HEADER):
+        raise BadRow(f"expected {len(HEADER)} fields, got {len(row)}")
+    try:
+        day = date.fromisoformat(row[0].strip())
+    except ValueError:
+        raise BadRow(f"bad date: {row[0]!r}")
+    sleep = _number(row[1], 'sleep')
+    mood = row[2].strip().capitalize() or None
+    if mood is not None and mood not in MOODS:
+        raise BadRow(f"unknown mood: {row[2]!r}")
+    water = _number(row[3], 'water_intake')
+    period = row[4].strip().lower()
+    if period not in ('yes', 'no'):
+        raise BadRow(f"period must be yes/no: {row[4]!r}")
+    return Entry(day, sleep, mood, water, period == 'yes', row[5])
+
+
+def iter_entries(store=None, on_bad=None):
+    """Lazily yield an Entry for every valid row in the store.
+
+    Invalid rows are skipped; pass ``on_bad(row, reason)`` to see them (for
+    example a Quarantine). Memory use doesn't grow with the file.
+    """
+    store = store or open_store()
+    for row in store.iter_rows():
+        if not row:
+            continue
+        try:
+            yield parse_row(row)
+        except BadRow as e:
+            if on_bad is not None:
+                on_bad(row, str(e))
+
+
+class Quarantine:
+    """on_bad callback that counts bad rows and copies them to a CSV file.
+
+    The file is rewritten on the first bad row of each pass, so it always
+    lists what the latest report skipped.
+    """
+
+    def __init__(self, path=QUARANTINE_FILE):
+        self.path = path
+        self.count = 0
+
+    def __call__(self, row, reason):
+        mode = 'a' if self.count else 'w'
+        self.count += 1
+        with open(self.path, mode, newline='') as f:
+            writer = csv.writer(f)
+            if mode == 'w':
+                writer.writerow(HEADER + ['reason'])
+            writer.writerow(list(row) + [reason])
+
+    def report(self):
+        if self.count:
+            print(f"⚠️ Skipped {self.count} invalid row(s); see {self.path}")
+
+
+def format_entry(e):
+    """Entry back to the comma-separated form the CLI prints."""
+    def num(v):
+        return '' if v is None else f"{v:g}"
+    return ', '.join([e.date.isoformat(), num(e.sleep), e.mood or '', num(e.water),
+                      'yes' if e.period else 'no', e.notes])
+
+
+@timed("summary.summarize")
+def summarize(entries):
+    """One pass over ``entries`` for every number the summary reports need.
+
+    Averages only use days where that value was logged. Goal streaks live in
+    analytics.py.
+    """
+    summary = {
+        'entries': 0,
+        'sleep_total': 0.0, 'sleep_days': 0,
+        'water_total': 0.0, 'water_days': 0,
+        'mood_counts': {m: 0 for m in MOODS},
+        'period_days': 0,
+    }
+    for e in entries:
+        summary['entries'] += 1
+        if e.sleep is not None:
+            summary['sleep_total'] += e.sleep
+            summary['sleep_days'] += 1
+        if e.water is not None:
+            summary['water_total'] += e.water
+            summary['water_days'] += 1
+        if e.mood is not None:
+            summary['mood_counts'][e.mood] += 1
+        if e.period:
+            summary['period_days'] += 1
+
+    summary['avg_sleep'] = summary['sleep_total'] / summary['sleep_days'] if summary['sleep_days'] else None
+    summary['avg_water'] = summary['water_total'] / summary['water_days'] if summary['water_days'] else None
+    return summary
+
+
+# -----------------------
+# Date-range queries
+# -----------------------
+def last_days(n, today=None):
+    """(start, end) of the ``n`` calendar days ending today."""
+    today = today or date.today()
+    return today - timedelta(days=n - 1), today
+
+
+def week_of(day):
+    """(Monday, Sunday) of the week containing ``day``."""
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=6)
+
+
+def month_of(year, month):
+    """(first, last) day of a calendar month."""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def iter_range(start, end, store=None, on_bad=None):
+    """Like iter_entries, for the dates ``start``..``end`` (dates or ISO strings) only.
+
+    Goes through the store's date index, so the cost follows the size of the
+    range rather than of the whole history.
+    """
+    store = store or open_store()
+    for row in store.range(str(start), str(end)):
+        if not row:
+            continue
+        try:
+            yield parse_row(row)
+        except BadRow as e:
+            if on_bad is not None:
+                on_bad(row, str(e))
+
+
+def page_entries(page, limit, start=None, end=None, newest_first=False, store=None, on_bad=None):
+    """(valid entries on 1-based ``page``, rows in the range) for ``limit`` rows a page.
+
+    Only that page's rows are read, through the store's date index; a bad
+    row still takes its place on the page and goes to ``on_bad``.
+    """
+    store = store or open_store()
+    start = None if start is None else str(start)
+    end = None if end is None else str(end)
+    rows = store.page((page - 1) * limit, limit, start, end, newest_first)
+    entries = []
+    for row in rows:
+        try:
+            entries.append(parse_row(row))
+        except BadRow as e:
+            if on_bad is not None:
+                on_bad(row, str(e))
+    return entries, store.count(start, end)
+
+
+@timed("records.query_entries")
+def query_entries(start, end, fields=Entry._fields, store=None, on_bad=None):
+    """{field: [values]} for the valid entries dated ``start``..``end``, oldest first.
+
+    ``fields`` picks the Entry fields returned (date, sleep, mood, water,
+    period, notes); values are parsed the same way as in Entry.
+    """
+    unknown = [f for f in fields if f not in Entry._fields]
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(unknown)}")
+    cols = {f: [] for f in fields}
+    picks = [(cols[f], Entry._fields.index(f)) for f in fields]
+    for e in iter_range(start, end, store, on_bad):
+        for values, i in picks:
+            values.append(e[i])
+    return cols
+
+
+@timed("summary.range_summary")
+def range_summary(start, end, store=None, on_bad=None):
+    """summarize() for the entries dated ``start``..``end``, from query_entries()."""
+    cols = query_entries(start, end, ('sleep', 'mood', 'water', 'period'), store, on_bad)
+    sleeps = [v for v in cols['sleep'] if v is not None]
+    waters = [v for v in cols['water'] if v is not None]
+    mood_counts = {m: 0 for m in MOODS}
+    for m in cols['mood']:
+        if m is not None:
+            mood_counts[m] += 1
+    return {
+        'start': date.fromisoformat(str(start)), 'end': date.fromisoformat(str(end)),
+        'entries': len(cols['period']),
+        'sleep_total': sum(sleeps), 'sleep_days': len(sleeps),
+        'water_total': sum(waters), 'water_days': len(waters),
+        'mood_counts': mood_counts,
+        'period_days': sum(cols['period']),
+        'avg_sleep': sum(sleeps) / len(sleeps) if sleeps else None,
+        'avg_water': sum(waters) / len(waters) if waters else None,
+    }
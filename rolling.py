@@ -0,0 +1,214 @@
+# rolling.py
+import os
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+from metrics import timed
+from records import MOODS, BadRow, parse_row
+from storage import one_write_apart
+
+WINDOWS = (7, 30, 90)
+# Days materialized back from today. Windows that reach back past the
+# first of them only count the days that are kept.
+HISTORY_DAYS = int(os.environ.get("TRACKER_ROLLING_DAYS", "3650"))
+# Entries dated further ahead than this are left out until they come near,
+# so one mistyped year can't stretch the views (or push out the real days)
+FUTURE_DAYS = 31
+
+# What one day adds to every window that covers it
+FIELDS = ("entries", "sleep_sum", "sleep_days", "water_sum", "water_days", *MOODS,
+          "goal_days", "goal_hits", "period_days")
+_F = {name: i for i, name in enumerate(FIELDS)}
+
+
+def contribution(row, sleep_goal, water_goal):
+    """The FIELDS vector for one row and its ordinal day, or None if the row isn't valid."""
+    try:
+        e = parse_row(["" if v is None else str(v) for v in row])
+    except BadRow:
+        return None
+    c = np.zeros(len(FIELDS))
+    c[_F["entries"]] = 1
+    if e.sleep is not None:
+        c[_F["sleep_sum"]], c[_F["sleep_days"]] = e.sleep, 1
+    if e.water is not None:
+        c[_F["water_sum"]], c[_F["water_days"]] = e.water, 1
+    if e.mood is not None:
+        c[_F[e.mood]] = 1
+    if e.sleep is not None and e.water is not None:
+        # same days and rule as analytics.goal_status(): both goals met
+        c[_F["goal_days"]] = 1
+        c[_F["goal_hits"]] = e.sleep >= sleep_goal and e.water >= water_goal
+    c[_F["period_days"]] = e.period
+    return e.date.toordinal(), c
+
+
+class RollingViews:
+    """Per-day sums over the last 7, 30 and 90 days, kept up to date by deltas.
+
+    Row ``i`` of ``sums[w]`` covers the ``w`` days ending on ``base + i``.
+    A save changes one day's contribution, so apply() adjusts only the
+    ``w`` rows whose window covers that day. A day past the end is added
+    by sliding: the previous row, plus the new day, minus the day that
+    leaves the window.
+    """
+
+    def __init__(self, sleep_goal=7.0, water_goal=2.0):
+        self.goals = (float(sleep_goal), float(water_goal))
+        self.version = None
+        self.base = None  # ordinal of row 0
+        self.n = 0  # rows in use; the arrays below may have spare capacity
+        self.last_entry = None  # date of the latest valid entry
+        self.next_future = None  # ordinal of the earliest entry left out as too far ahead
+        self.days = np.zeros((0, len(FIELDS)))
+        self.sums = {w: np.zeros((0, len(FIELDS))) for w in WINDOWS}
+
+    def _too_far(self, day, today=None):
+        if day <= (today or date.today().toordinal()) + FUTURE_DAYS:
+            return False
+        self.next_future = day if self.next_future is None else min(self.next_future, day)
+        return True
+
+    def rebuild(self, rows, version, today=None):
+        today = (today or date.today()).toordinal()
+        last = today + FUTURE_DAYS
+        self.next_future = None
+        latest = {}
+        for r in rows:
+            c = contribution(r, *self.goals) if r else None
+            if c is not None and not self._too_far(c[0], today):
+                latest[c[0]] = c[1]  # later rows win
+        self.base = today - HISTORY_DAYS + 1  # fixed span, so older saves never need a rebuild
+        self.n = last - self.base + 1
+        self.last_entry = date.fromordinal(max(latest)) if latest else None
+        self.days = np.zeros((self.n, len(FIELDS)))
+        for d, c in latest.items():
+            if d >= self.base:
+                self.days[d - self.base] = c
+        total = np.vstack([np.zeros(len(FIELDS)), np.cumsum(self.days, axis=0)])
+        idx = np.arange(self.n)
+        self.sums = {w: total[idx + 1] - total[np.maximum(0, idx - w + 1)] for w in WINDOWS}
+        self.version = version
+
+    def _grow(self, rows):
+        if rows <= len(self.days):
+            return
+        cap = max(rows, 2 * len(self.days))
+        self.days = np.vstack([self.days, np.zeros((cap - len(self.days), len(FIELDS)))])
+        for w, s in self.sums.items():
+            self.sums[w] = np.vstack([s, np.zeros((cap - len(s), len(FIELDS)))])
+
+    def _extend(self, day):
+        """Slide every window forward to ordinal ``day``, one O(1) step per day."""
+        end = day - self.base + 1
+        self._grow(end)
+        for i in range(self.n, end):
+            for w, s in self.sums.items():
+                s[i] = s[i - 1] + self.days[i]
+                if i - w >= 0:
+                    s[i] -= self.days[i - w]
+        self.n = max(self.n, end)
+
+    def _add(self, day, delta):
+        if self._too_far(day):
+            return False
+        i = day - self.base
+        if i < 0:
+            if i + max(WINDOWS) > 0:
+                self.version = None  # inside a kept window but not materialized: rebuild
+            return True
+        if i >= self.n:
+            self._extend(day)
+        self.days[i] += delta
+        for w, s in self.sums.items():
+            s[i:min(i + w, self.n)] += delta  # only the windows that cover this day
+        return True
+
+    def apply(self, old, new):
+        """Swap ``old`` for ``new`` (either may be None) in the views."""
+        for row, sign in ((old, -1), (new, 1)):
+            c = contribution(row, *self.goals) if row else None
+            if c is None:
+                continue
+            kept = self._add(c[0], sign * c[1])
+            if kept and sign > 0 and (self.last_entry is None or c[0] > self.last_entry.toordinal()):
+                self.last_entry = date.fromordinal(c[0])
+        if old and not new and self.last_entry is not None and str(old[0]) == self.last_entry.isoformat():
+            logged = np.flatnonzero(self.days[:self.n, _F["entries"]])
+            self.last_entry = date.fromordinal(self.base + int(logged[-1])) if len(logged) else None
+
+    def _sums_at(self, w, day):
+        i = day.toordinal() - self.base
+        if i < 0 or self.n == 0:
+            return np.zeros(len(FIELDS))
+        if i < self.n:
+            return self.sums[w][i]
+        # past the materialized end: only days up to the end have entries
+        return self.days[max(0, i - w + 1):self.n].sum(axis=0)
+
+    def window(self, w, day=None):
+        """Summary of the ``w`` days ending on ``day`` (default today).
+
+        Same keys as records.range_summary() plus mood_share and
+        goal_hit_ratio (None when no day had both sleep and water logged).
+        """
+        day = day or date.today()
+        s = self._sums_at(w, day)
+        entries = int(round(s[_F["entries"]]))
+        sleep_days, water_days = int(round(s[_F["sleep_days"]])), int(round(s[_F["water_days"]]))
+        goal_days = int(round(s[_F["goal_days"]]))
+        moods = {m: int(round(s[_F[m]])) for m in MOODS}
+        logged = sum(moods.values())
+        return {
+            'start': day - timedelta(days=w - 1), 'end': day,
+            'entries': entries,
+            'avg_sleep': float(s[_F["sleep_sum"]] / sleep_days) if sleep_days else None,
+            'avg_water': float(s[_F["water_sum"]] / water_days) if water_days else None,
+            'sleep_days': sleep_days, 'water_days': water_days,
+            'mood_counts': moods,
+            'mood_share': {m: n / logged for m, n in moods.items()} if logged else {},
+            'goal_days': goal_days,
+            'goal_hit_ratio': float(s[_F["goal_hits"]] / goal_days) if goal_days else None,
+            'period_days': int(round(s[_F["period_days"]])),
+        }
+
+
+_views = {}
+_lock = threading.Lock()
+
+
+@timed("rolling.views_for")
+def views_for(store, sleep_goal=7.0, water_goal=2.0):
+    """The up-to-date RollingViews for ``store``, rebuilding only if out of sync."""
+    with _lock:
+        views = _views.get(store.cache_key)
+        version = store.version()
+        if views is None or views.goals != (float(sleep_goal), float(water_goal)):
+            views = _views[store.cache_key] = RollingViews(sleep_goal, water_goal)
+        if (views.version is None or views.version != version
+                or views.next_future is not None
+                and views.next_future <= date.today().toordinal() + FUTURE_DAYS):
+            views.rebuild(store.read_all(), version)
+        return views
+
+
+def record_change(store, version_before, old, new):
+    """Apply one save/delete made on ``store``; see aggregates.record_change."""
+    with _lock:
+        views = _views.get(store.cache_key)
+        if views is None or views.version is None or views.version != version_before:
+            return
+        after = store.version()
+        if not one_write_apart(version_before, after):
+            views.version = None  # another save landed in between: rebuild
+            return
+        views.apply(old, new)
+        if views.version is not None:
+            views.version = after
+
+
+def forget(store):
+    with _lock:
+        _views.pop(store.cache_key, None)
@@ -0,0 +1,1347 @@
+# storage.py
+import contextlib
+import csv
+import heapq
+import io
+import json
+import locale
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from date_index import DateIndex
+from metrics import timed
+
+HEADER = ['date', 'sleep', 'mood', 'water_intake', 'period', 'notes']
+DATA_FILE = "tracker_data.csv"
+
+# "csv" rewrites the whole file on every save (the original behaviour),
+# "log" appends small change records and compacts them in the background,
+# "sqlite" keeps entries in a date-keyed SQLite table next to the CSV,
+# "partitioned" keeps one CSV per month and "binary" fixed-width day
+# records read through mmap (binstore.py).
+STORAGE_MODE = os.environ.get("TRACKER_STORAGE", "csv").strip().lower()
+COMPACT_THRESHOLD = int(os.environ.get("TRACKER_COMPACT_THRESHOLD", "500"))
+PAGE_SIZE = 50  # rows per page for page() callers that don't pick one
+ITER_CHUNK = 64 * 1024  # rows fetched at a time when iter_rows() streams
+CACHE_SIZE = int(os.environ.get("TRACKER_CACHE_SIZE", "8"))
+# How long the first save waits for others to join its durable commit
+COMMIT_WINDOW = float(os.environ.get("TRACKER_COMMIT_WINDOW", "0.01"))
+
+
+# -----------------------
+# Parsed-entry cache
+# -----------------------
+# Parsed rows per data file, keyed by the file's (device, inode, mtime, size).
+# Our own writes drop the entry straight away because a same-size edit (e.g.
+# a yes/no toggle) can land within the filesystem's mtime granularity.
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def file_version(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _cache_get(key, version):
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is None or hit[0] != version:
+            return None
+        _cache.move_to_end(key)
+        return hit[1]
+
+
+def _cache_put(key, version, rows):
+    with _cache_lock:
+        _cache[key] = (version, rows)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def invalidate_cache(key=None):
+    with _cache_lock:
+        if key is None:
+            _cache.clear()
+        else:
+            _cache.pop(key, None)
+
+
+def _text_row(row):
+    # what the row looks like once written to and read back from the file
+    row = ["" if v is None else str(v) for v in row]
+    return (row + [""] * len(HEADER))[:len(HEADER)]
+
+
+# -----------------------
+# Concurrency
+# -----------------------
+class ConflictError(Exception):
+    """A save was based on a row that someone else has changed since."""
+
+
+# Marks "no expectation" for the ``expected`` argument of upsert/delete
+ANY = object()
+
+
+def one_write_apart(before, after):
+    """True if exactly one save on this store lies between two version() values.
+
+    Derived caches apply a save as a delta only when this holds; if another
+    session's save landed in between, their totals must be rebuilt.
+    """
+    return before is not None and after is not None and after[0] == before[0] + 1
+
+
+def _check_expected(current, expected, day):
+    if expected is ANY:
+        return
+    if expected is not None:
+        expected = _text_row(expected)
+    if current is not None:
+        current = _text_row(current)
+    if current != expected:
+        raise ConflictError(f"{day} was changed by someone else")
+
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive advisory lock on ``path`` (created if needed) between processes.
+
+    Only writers take it. Readers never wait: every write lands through an
+    atomic rename or an append, so a reader sees either the old data or the
+    new data.
+    """
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# -----------------------
+# Durable writes
+# -----------------------
+def _fsync_dir(path):
+    # makes a rename itself durable; not possible (or needed) on Windows
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def durable_write_rows(path, rows):
+    """Write header + rows to a temp file, fsync it and rename it over ``path``.
+
+    A crash at any point leaves either the old file or the new one, never a
+    truncated mix.
+    """
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                               dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        # mkstemp creates the file 0600; keep the mode the data file had
+        try:
+            os.chmod(tmp, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            os.chmod(tmp, 0o666 & ~_umask())
+        with os.fdopen(fd, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _fsync_dir(path)
+
+
+class GroupCommitWriter:
+    """Turns saves that arrive close together into one durable commit.
+
+    The first caller of submit() becomes the leader: it waits ``window``
+    seconds for others to queue up, runs ``commit(batch)`` once for everything
+    queued, and repeats until the queue is empty. Every caller returns only
+    after a commit covering its own save has finished, so nothing is reported
+    saved before it is on disk.
+    """
+
+    def __init__(self, commit, window=COMMIT_WINDOW):
+        self._commit = commit
+        self.window = window
+        self._cond = threading.Condition()
+        self._queue = []
+        self._submitted = 0
+        self._durable = 0
+        self._failed = 0
+        self._error = None
+        self._leading = False
+
+    def submit(self, payload=None):
+        self.wait(self.enqueue(payload))
+
+    def enqueue(self, payload=None):
+        """Queue a save and return its ticket for wait().
+
+        Call it while the save's change is still held under the caller's own
+        lock, so a failing commit that drops that change also fails the ticket.
+        """
+        with self._cond:
+            self._queue.append(payload)
+            self._submitted += 1
+            return self._submitted
+
+    def wait(self, seq):
+        """Return once the save ``seq`` is on disk (leading the commit if no one is)."""
+        with self._cond:
+            if self._durable >= seq:
+                return
+            if self._failed >= seq:
+                raise self._error
+            if self._leading:
+                while self._durable < seq and self._failed < seq:
+                    self._cond.wait()
+                if self._durable < seq:
+                    raise self._error
+                return
+            self._leading = True
+
+        if self.window > 0:
+            time.sleep(self.window)
+        while True:
+            with self._cond:
+                batch, self._queue = self._queue, []
+                upto = self._submitted
+                if not batch:
+                    self._leading = False
+                    return
+            try:
+                self._commit(batch)
+            except BaseException as e:
+                with self._cond:
+                    # The commit dropped every change pending so far, so fail
+                    # whatever queued behind it too: no one is left to lead.
+                    self._failed, self._error = self._submitted, e
+                    self._queue = []
+                    self._leading = False
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._durable = upto
+                self._cond.notify_all()
+
+
+# -----------------------
+# Reading the end of a CSV
+# -----------------------
+def tail_rows(path, n, chunk_size=64 * 1024):
+    """Last ``n`` rows of a CSV with a header, reading backwards from the end.
+
+    A newline ends a record only if the text after it holds an even number of
+    quote characters; otherwise it sits inside a quoted (multi-line) note.
+    csv.writer only emits quotes in balanced pairs, so that parity test is
+    exact and only the tail of the file is ever read.
+    """
+    if n <= 0:
+        return []
+    encoding = locale.getpreferredencoding(False)
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buf = b""
+        scan = 0  # newlines at or after buf[scan] have been looked at
+        quotes = 0  # quote characters in buf[scan:]
+        boundaries = 0
+        while True:
+            j = buf.rfind(b"\n", 0, scan)
+            if j == -1:
+                quotes += buf[:scan].count(b'"')
+                if pos == 0:
+                    # reached the start: everything but the header
+                    rows = [r for r in csv.reader(io.StringIO(buf.decode(encoding), newline="")) if r]
+                    return rows[1:][-n:]
+                step = min(chunk_size, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+                scan = step
+                continue
+            quotes += buf[j + 1:scan].count(b'"')
+            scan = j
+            if quotes % 2:
+                continue  # newline inside a quoted field
+            boundaries += 1
+            if boundaries > n:
+                text = buf[j + 1:].decode(encoding)
+                rows = [r for r in csv.reader(io.StringIO(text, newline="")) if r]
+                if len(rows) >= n:
+                    return rows[-n:]
+
+
+# -----------------------
+# Plain CSV store
+# -----------------------
+class CsvStore:
+    def __init__(self, path):
+        self.path = path
+        self.cache_key = ("csv", os.path.abspath(path))
+        self._lock = threading.Lock()
+        self._writes = 0  # our own writes, part of version()
+        # State saved in memory but not yet committed to disk: a DateIndex
+        # after upsert/delete, or a plain row list after write_all.
+        self._live = None
+        # Row changes since the last commit, as (op, arg, expected, ticket),
+        # replayed on top of the file if another process wrote it meanwhile.
+        self._pending_ops = []
+        # ticket -> ConflictError for saves whose ``expected`` failed that replay
+        self._conflicts = {}
+        # file_version() of the data file that the in-memory state builds on
+        self._base_version = None
+        self.lock_path = path + ".lock"
+        self._writer = GroupCommitWriter(self._commit_live)
+
+    @property
+    def index_key(self):
+        return ("index",) + self.cache_key
+
+    def _invalidate(self):
+        self._writes += 1
+        invalidate_cache(self.cache_key)
+        invalidate_cache(self.index_key)
+
+    def index(self):
+        """DateIndex over the current rows, built once per file version."""
+        if isinstance(self._live, DateIndex):
+            return self._live
+        version = self.version()
+        idx = _cache_get(self.index_key, version)
+        if idx is None:
+            idx = DateIndex(self.read_all())
+            _cache_put(self.index_key, version, idx)
+        return idx
+
+    def _keep_index(self, idx):
+        # After our own write the updated index *is* the new file contents,
+        # so carry it (and its rows) over instead of re-parsing.
+        version = self.version()
+        _cache_put(self.cache_key, version, idx.rows())
+        _cache_put(self.index_key, version, idx)
+
+    def ensure_file(self):
+        if not os.path.exists(self.path):
+            with open(self.path, "w", newline="") as f:
+                csv.writer(f).writerow(HEADER)
+
+    def _read_base(self):
+        self.ensure_file()
+        with open(self.path, "r", newline="") as f:
+            rows = list(csv.reader(f))
+        return rows[1:]  # skip header
+
+    def version(self):
+        """Changes whenever the data may have: our own writes or the file's stat.
+
+        Anything derived from the rows (caches, indexes, aggregates) can be
+        keyed on it. Like every store's version, it starts with the count of
+        this store's own writes, one per save; see one_write_apart().
+        """
+        return (self._writes, file_version(self.path))
+
+    def _load(self):
+        return self._read_base()
+
+    @timed("store.read_all")
+    def read_all(self):
+        """All rows, parsed at most once per version of the file.
+
+        The row lists are shared with the cache, so don't modify them in
+        place; the outer list is a fresh copy.
+        """
+        live = self._live
+        if live is not None:
+            return live.rows() if isinstance(live, DateIndex) else list(live)
+        self.ensure_file()
+        version = self.version()
+        rows = _cache_get(self.cache_key, version)
+        if rows is None:
+            rows = self._load()
+            _cache_put(self.cache_key, version, rows)
+        return list(rows)
+
+    def tail(self, n):
+        """The ``n`` latest dates, oldest first.
+
+        Every write keeps the file in date order, so a cold read only seeks
+        back from the end (tail_rows). A file edited by hand out of order
+        gives its last rows in file order instead.
+        """
+        if n <= 0:
+            return []
+        if self._live is not None or _cache_get(self.index_key, self.version()) is not None:
+            return self.index().page(0, n, newest_first=True)[::-1]
+        self.ensure_file()
+        return tail_rows(self.path, n)
+
+    def iter_rows(self):
+        """Yield rows one at a time without holding the whole file."""
+        if self._live is not None:
+            yield from self.read_all()
+            return
+        self.ensure_file()
+        cached = _cache_get(self.cache_key, self.version())
+        if cached is not None:
+            yield from cached
+            return
+        with open(self.path, "r", newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)  # header
+            yield from reader
+
+    def _write_base(self, rows):
+        durable_write_rows(self.path, rows)
+        self._invalidate()
+
+    def _commit_live(self, batch):
+        # One file write for every save queued in this batch
+        with file_lock(self.lock_path):
+            with self._lock:
+                live, ops, base = self._live, self._pending_ops, self._base_version
+                self._pending_ops = []
+                writes = self._writes
+            if live is None:
+                return
+            if file_version(self.path) != base:
+                # Another process (or an earlier commit of ours that raced
+                # newer changes) wrote the file: merge our row changes by date.
+                live = DateIndex(self._read_base())
+                conflicts = {}
+                for op, arg, expected, ticket in ops:
+                    if op == "all":
+                        live = DateIndex(arg)
+                        continue
+                    day = arg[0] if op == "put" else arg
+                    try:
+                        # what we saw may be stale now: check it against the file
+                        _check_expected(live.get(day), expected, day)
+                    except ConflictError as e:
+                        conflicts[ticket] = e
+                        continue
+                    if op == "put":
+                        live.upsert(arg)
+                    else:
+                        live.delete(arg)
+                with self._lock:
+                    self._conflicts.update(conflicts)
+            rows = live.rows() if isinstance(live, DateIndex) else live
+            try:
+                durable_write_rows(self.path, rows)
+            except BaseException:
+                with self._lock:
+                    self._live = None
+                    self._pending_ops = []
+                    self._invalidate()
+                raise
+            written = file_version(self.path)
+        with self._lock:
+            if self._writes == writes:
+                # nothing changed meanwhile: the file now matches memory
+                self._live = None
+                self._base_version = written
+                if isinstance(live, DateIndex):
+                    self._keep_index(live)
+                else:
+                    _cache_put(self.cache_key, self.version(), live)
+
+    def _start_change(self):
+        # Called under self._lock: the index the next change applies to
+        if self._live is None:
+            self._base_version = file_version(self.path)
+        return self.index()
+
+    @timed("store.write_all")
+    def write_all(self, rows):
+        with self._lock:
+            if self._live is None:
+                self._base_version = file_version(self.path)
+            # sorted, so the file stays in date order for tail()
+            self._live = sorted((r for r in rows if r), key=lambda r: r[0])
+            self._pending_ops.append(("all", self._live, ANY, None))
+            self._invalidate()
+            ticket = self._writer.enqueue()
+        self._writer.wait(ticket)
+
+    def append(self, row):
+        # the file lock always comes before self._lock
+        with file_lock(self.lock_path), self._lock:
+            last = tail_rows(self.path, 1) if self._live is None and os.path.exists(self.path) else []
+            # a plain append only while it keeps the file in date order
+            if self._live is None and (not last or str(row[0]) >= last[0][0]):
+                self.ensure_file()
+                with open(self.path, "a", newline="") as f:
+                    csv.writer(f).writerow(row)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._invalidate()
+                return
+        # a commit is pending (and would overwrite a plain append), or the
+        # row belongs before the end of the file
+        self.upsert(row)
+
+    def _change(self, day, expected, op):
+        # apply one row change in memory, then let the writer commit it
+        with self._lock:
+            idx = self._start_change()
+            _check_expected(idx.get(day), expected, day)
+            if op[0] == "put":
+                idx.upsert(op[1])
+            else:
+                idx.delete(op[1])
+            self._live = idx
+            self._invalidate()
+            self._keep_index(idx)
+            ticket = self._writer.enqueue()
+            self._pending_ops.append((*op, expected, ticket))
+        try:
+            self._writer.wait(ticket)
+        finally:
+            with self._lock:
+                conflict = self._conflicts.pop(ticket, None)
+        if conflict is not None:
+            # another process changed the row before our commit reached the file
+            raise conflict
+
+    @timed("store.upsert")
+    def upsert(self, row, expected=ANY):
+        """Save ``row`` for its date.
+
+        Pass ``expected`` (the row you read, or None if there was none) to
+        raise ConflictError instead of overwriting a change made since.
+        """
+        row = _text_row(row)
+        self._change(row[0], expected, ("put", row))
+
+    @timed("store.delete")
+    def delete(self, day, expected=ANY):
+        self._change(day, expected, ("del", day))
+
+    @timed("store.upsert_many")
+    def upsert_many(self, rows):
+        """Save many rows (later ones win per date) in a single file write."""
+        rows = [_text_row(r) for r in rows if r]
+        with self._lock:
+            idx = self._start_change()
+            for row in rows:
+                idx.upsert(row)
+            self._live = idx
+            self._pending_ops.extend(("put", row, ANY, None) for row in rows)
+            self._invalidate()
+            self._keep_index(idx)
+            ticket = self._writer.enqueue()
+        self._writer.wait(ticket)
+
+    def get(self, day):
+        return self.index().get(day)
+
+    def range(self, start, end):
+        """Rows with ``start <= date <= end`` (ISO strings), oldest first."""
+        return self.index().range(start, end)
+
+    def count(self, start=None, end=None):
+        """Number of dates in the range (None = unbounded)."""
+        return self.index().count(start, end)
+
+    def page(self, offset=0, limit=PAGE_SIZE, start=None, end=None, newest_first=False):
+        """One page of the range in date order, without copying the rest."""
+        return self.index().page(offset, limit, start, end, newest_first)
+
+    def dates(self):
+        return self.index().dates()
+
+
+# -----------------------
+# Append-only log store
+# -----------------------
+class LogStore(CsvStore):
+    """Base CSV plus an append-only log of 'put'/'del' records.
+
+    Saves only append to ``<path>.log``; once the log grows past
+    ``compact_threshold`` records a background thread folds it back into a
+    date-sorted base file. Reads always return the merged state.
+    """
+
+    def __init__(self, path, compact_threshold=COMPACT_THRESHOLD):
+        super().__init__(path)
+        self.cache_key = ("log", os.path.abspath(path))
+        self.log_path = path + ".log"
+        self.compact_threshold = compact_threshold
+        self._compactor = None
+        self._log_records = None  # counted lazily
+        self._generation = 0  # bumped by write_all so a stale compaction backs off
+        self._log_writer = GroupCommitWriter(self._sync_log)
+
+    def _sync_log(self, batch):
+        # one fsync covers every record appended since the last one
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "ab") as f:
+                os.fsync(f.fileno())
+
+    def _read_log(self):
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path, "r", newline="", encoding="utf-8") as f:
+            return list(csv.reader(f))
+
+    @staticmethod
+    def _changes(records):
+        """Last state per date in the log: the row, or None if deleted."""
+        changes = {}
+        for rec in records:
+            op = rec[0] if rec else ""
+            if op == "put" and len(rec) == len(HEADER) + 1:
+                changes[rec[1]] = rec[1:]
+            elif op == "del" and len(rec) >= 2:
+                changes[rec[1]] = None
+            # anything else is a torn trailing record; ignore it
+        return changes
+
+    @classmethod
+    def _fold(cls, base_rows, records):
+        if not records:
+            return base_rows
+        merged = {}
+        for r in base_rows:
+            if r:
+                merged[r[0]] = r
+        for day, row in cls._changes(records).items():
+            if row is None:
+                merged.pop(day, None)
+            else:
+                merged[day] = row
+        return [merged[d] for d in sorted(merged)]
+
+    def version(self):
+        return (self._writes, file_version(self.path), file_version(self.log_path))
+
+    def _load(self):
+        return self._fold(self._read_base(), self._read_log())
+
+    def iter_rows(self):
+        """Stream the base file with the log applied; only the log is held.
+
+        The base is date-sorted (every write and compaction keeps it so),
+        and the log's puts are merged in at their dates. Reading the log
+        first is safe against a compaction in between: the new base then
+        already holds those records, and replaying them changes nothing.
+        """
+        cached = _cache_get(self.cache_key, self.version())
+        if cached is not None:
+            yield from cached
+            return
+        changes = self._changes(self._read_log())
+        puts = [changes[d] for d in sorted(changes) if changes[d] is not None]
+        self.ensure_file()
+        with open(self.path, "r", newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)  # header
+            base = (r for r in reader if r and r[0] not in changes)
+            yield from heapq.merge(base, puts, key=lambda r: r[0])
+
+    def tail(self, n):
+        # the base file's end misses the log, so use the merged index
+        return self.index().page(0, n, newest_first=True)[::-1] if n > 0 else []
+
+    def _append_records(self, records, day=None, expected=ANY):
+        with file_lock(self.lock_path), self._lock:
+            if expected is not ANY:
+                # under the file lock, so no other process can slip in
+                _check_expected(self.get(day), expected, day)
+            idx = _cache_get(self.index_key, self.version())
+            with open(self.log_path, "a", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(records)
+            self._invalidate()
+            if idx is not None:
+                for rec in records:
+                    if rec[0] == "put":
+                        idx.upsert(rec[1:])
+                    else:
+                        idx.delete(rec[1])
+                self._keep_index(idx)
+            if self._log_records is None:
+                self._log_records = len(self._read_log())
+            else:
+                self._log_records += len(records)
+            needs_compaction = self._log_records >= self.compact_threshold
+        self._log_writer.submit()
+        if needs_compaction:
+            self.compact_in_background()
+
+    def append(self, row):
+        self.upsert(row)
+
+    @timed("store.upsert")
+    def upsert(self, row, expected=ANY):
+        row = _text_row(row)
+        self._append_records([["put"] + row], row[0], expected)
+
+    @timed("store.delete")
+    def delete(self, day, expected=ANY):
+        self._append_records([["del", day]], day, expected)
+
+    @timed("store.upsert_many")
+    def upsert_many(self, rows):
+        records = [["put"] + _text_row(r) for r in rows if r]
+        if records:
+            self._append_records(records)
+
+    @timed("store.write_all")
+    def write_all(self, rows):
+        # A full replacement (reset) supersedes any pending log records.
+        with file_lock(self.lock_path), self._lock:
+            self._write_base(rows)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+                _fsync_dir(self.log_path)
+            self._invalidate()
+            self._log_records = 0
+            self._generation += 1
+
+    @timed("store.compact")
+    def compact(self):
+        """Fold the log into a sorted base file.
+
+        Records appended while the fold is running are carried over into the
+        new log. Replaying already-folded records is harmless because each
+        record sets the full state of its date. The file lock is held
+        throughout so another process can't compact or reset underneath us;
+        its appends just wait.
+        """
+        with file_lock(self.lock_path):
+            with self._lock:
+                if not os.path.exists(self.log_path):
+                    return
+                snapshot = os.path.getsize(self.log_path)
+                generation = self._generation
+            # Offsets are in bytes, so work on the raw file here.
+            with open(self.log_path, "rb") as f:
+                folded_text = f.read(snapshot).decode("utf-8")
+            records = list(csv.reader(folded_text.splitlines(keepends=True)))
+            rows = self._fold(self._read_base(), records)
+            rows.sort(key=lambda r: r[0])
+            with self._lock:
+                if generation != self._generation or not os.path.exists(self.log_path):
+                    return
+                self._write_base(rows)
+                with open(self.log_path, "rb") as f:
+                    f.seek(snapshot)
+                    tail = f.read()
+                tmp = self.log_path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.log_path)
+                _fsync_dir(self.log_path)
+                self._invalidate()
+                self._log_records = None  # recount on next append
+
+    def compact_in_background(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, daemon=True)
+        self._compactor.start()
+
+
+# -----------------------
+# SQLite store
+# -----------------------
+_SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    date TEXT PRIMARY KEY,
+    sleep TEXT NOT NULL DEFAULT '',
+    mood TEXT NOT NULL DEFAULT '',
+    water_intake TEXT NOT NULL DEFAULT '',
+    period TEXT NOT NULL DEFAULT '',
+    notes TEXT NOT NULL DEFAULT ''
+) WITHOUT ROWID
+"""
+_SQL_SELECT = "SELECT date, sleep, mood, water_intake, period, notes FROM entries"
+_SQL_ALL = _SQL_SELECT + " ORDER BY date"
+_SQL_GET = _SQL_SELECT + " WHERE date = ?"
+_SQL_RANGE = _SQL_SELECT + " WHERE date BETWEEN ? AND ? ORDER BY date"
+_SQL_TAIL = _SQL_SELECT + " ORDER BY date DESC LIMIT ?"
+_SQL_FIRST = _SQL_ALL + " LIMIT ?"
+_SQL_AFTER = _SQL_SELECT + " WHERE date > ? ORDER BY date LIMIT ?"
+_SQL_DATES = "SELECT date FROM entries ORDER BY date"
+_SQL_COUNT = "SELECT COUNT(*) FROM entries"
+_SQL_UPSERT = "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)"
+_SQL_DELETE = "DELETE FROM entries WHERE date = ?"
+
+
+def _sql_where(start, end):
+    """WHERE clause and parameters for an optional date range."""
+    terms, params = [], []
+    if start is not None:
+        terms.append("date >= ?")
+        params.append(start)
+    if end is not None:
+        terms.append("date <= ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(terms) if terms else ""), params
+
+
+class SqliteStore:
+    """Entries in one SQLite table whose primary key (and index) is the date.
+
+    A single connection is reused for the life of the process; the fixed
+    statements above are cached by sqlite3, so point and range reads cost
+    O(log n) instead of a scan of the whole history.
+    """
+
+    def __init__(self, db_path):
+        self.path = db_path
+        self.cache_key = ("sqlite", os.path.abspath(db_path))
+        self._writes = 0
+        self._lock = threading.Lock()
+        # Streamlit reruns scripts on worker threads, so share across threads
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SQL_SCHEMA)
+        self._conn.commit()
+
+    def ensure_file(self):
+        pass  # the table is created on connect
+
+    def version(self):
+        # data_version only moves for commits from *other* connections, so
+        # count our own writes alongside it.
+        with self._lock:
+            return (self._writes, self._conn.execute("PRAGMA data_version").fetchone()[0])
+
+    def _invalidate(self):
+        self._writes += 1
+        invalidate_cache(self.cache_key)
+
+    @timed("store.read_all")
+    def read_all(self):
+        version = self.version()
+        rows = _cache_get(self.cache_key, version)
+        if rows is None:
+            with self._lock:
+                rows = [list(r) for r in self._conn.execute(_SQL_ALL)]
+            _cache_put(self.cache_key, version, rows)
+        return list(rows)
+
+    def iter_rows(self):
+        """Yield rows in date order, ITER_CHUNK at a time off the date index.
+
+        Each chunk resumes after the last date seen rather than holding a
+        cursor open, so other threads can use the connection in between.
+        """
+        cached = _cache_get(self.cache_key, self.version())
+        if cached is not None:
+            yield from cached
+            return
+        sql, params = _SQL_FIRST, ()
+        while True:
+            with self._lock:
+                chunk = [list(r) for r in self._conn.execute(sql, (*params, ITER_CHUNK))]
+            yield from chunk
+            if len(chunk) < ITER_CHUNK:
+                return
+            sql, params = _SQL_AFTER, (chunk[-1][0],)
+
+    def tail(self, n):
+        """The ``n`` latest dates, oldest first."""
+        if n <= 0:
+            return []
+        with self._lock:
+            rows = [list(r) for r in self._conn.execute(_SQL_TAIL, (n,))]
+        rows.reverse()
+        return rows
+
+    def get(self, day):
+        with self._lock:
+            r = self._conn.execute(_SQL_GET, (day,)).fetchone()
+        return list(r) if r else None
+
+    def range(self, start, end):
+        with self._lock:
+            return [list(r) for r in self._conn.execute(_SQL_RANGE, (start, end))]
+
+    def count(self, start=None, end=None):
+        where, params = _sql_where(start, end)
+        with self._lock:
+            return self._conn.execute(_SQL_COUNT + where, params).fetchone()[0]
+
+    def page(self, offset=0, limit=PAGE_SIZE, start=None, end=None, newest_first=False):
+        """One page of the range; LIMIT/OFFSET walks the date index, not the table."""
+        where, params = _sql_where(start, end)
+        order = " ORDER BY date DESC" if newest_first else " ORDER BY date"
+        sql = _SQL_SELECT + where + order + " LIMIT ? OFFSET ?"
+        with self._lock:
+            return [list(r) for r in self._conn.execute(sql, (*params, limit, offset))]
+
+    def dates(self):
+        with self._lock:
+            return [r[0] for r in self._conn.execute(_SQL_DATES)]
+
+    def _change(self, day, expected, sql, params):
+        with self._lock, self._conn:
+            if expected is not ANY:
+                # IMMEDIATE takes the write lock up front, so the check and
+                # the write see the same row
+                self._conn.execute("BEGIN IMMEDIATE")
+                r = self._conn.execute(_SQL_GET, (day,)).fetchone()
+                _check_expected(list(r) if r else None, expected, day)
+            self._conn.execute(sql, params)
+        self._invalidate()
+
+    @timed("store.upsert")
+    def upsert(self, row, expected=ANY):
+        row = _text_row(row)
+        self._change(row[0], expected, _SQL_UPSERT, row)
+
+    def append(self, row):
+        self.upsert(row)
+
+    @timed("store.delete")
+    def delete(self, day, expected=ANY):
+        self._change(day, expected, _SQL_DELETE, (day,))
+
+    @timed("store.upsert_many")
+    def upsert_many(self, rows):
+        with self._lock, self._conn:
+            self._conn.executemany(_SQL_UPSERT, (_text_row(r) for r in rows if r))
+        self._invalidate()
+
+    @timed("store.write_all")
+    def write_all(self, rows):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.executemany(_SQL_UPSERT, (_text_row(r) for r in rows if r))
+        self._invalidate()
+
+    def close(self):
+        self._conn.close()
+
+
+def sqlite_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + ".db"
+
+
+def migrate_csv_to_sqlite(csv_path=DATA_FILE, db_path=None):
+    """One-shot copy of an existing CSV into a SQLite store.
+
+    Later rows win when a date appears more than once. Returns the number of
+    dates stored.
+    """
+    db_path = db_path or sqlite_path_for(csv_path)
+    rows = CsvStore(csv_path).read_all() if os.path.exists(csv_path) else []
+    store = SqliteStore(db_path)
+    store.write_all(rows)
+    with store._lock:
+        count = store._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    store.close()
+    return count
+
+
+# -----------------------
+# Partitioned store
+# -----------------------
+PARTITION_CACHE_SIZE = 24  # months of parsed rows kept per store
+UNDATED = "0000-00"  # partition for rows whose date can't be read
+
+
+def _month_of(day):
+    day = str(day)
+    if len(day) >= 7 and day[:4].isdigit() and day[4] == "-" and day[5:7].isdigit():
+        return day[:7]
+    return UNDATED
+
+
+class PartitionedStore:
+    """One CSV per calendar month plus a manifest of the months and their sizes.
+
+        tracker_data.parts/manifest.json
+        tracker_data.parts/2025-07.csv
+        tracker_data.parts/2025-08.csv
+
+    Reads of a date range only open the months it overlaps, and a save
+    rewrites just its own month, so the cost follows the month you look at
+    rather than the whole history. Each partition is sorted by date with one
+    row per date.
+    """
+
+    def __init__(self, root):
+        self.path = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.lock_path = os.path.join(root, "manifest.lock")
+        self.cache_key = ("parts", os.path.abspath(root))
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._parts = OrderedDict()  # month -> (file version, rows)
+        self._manifest_cache = None  # (file version, manifest)
+
+    def ensure_file(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def version(self):
+        # every write goes through the manifest, ours or another process's
+        return (self._writes, file_version(self.manifest_path))
+
+    def _invalidate(self):
+        self._writes += 1
+        invalidate_cache(self.cache_key)
+
+    def manifest(self):
+        """{month: {"rows", "first", "last"}} for every partition on disk."""
+        version = file_version(self.manifest_path)
+        cached = self._manifest_cache
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        try:
+            with open(self.manifest_path, "r") as f:
+                parts = json.load(f).get("partitions", {})
+        except FileNotFoundError:
+            parts = {}
+        self._manifest_cache = (version, parts)
+        return parts
+
+    def _write_manifest(self, parts):
+        self.ensure_file()
+        fd, tmp = tempfile.mkstemp(prefix="manifest.", suffix=".tmp", dir=self.path)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"partitions": dict(sorted(parts.items()))}, f, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.manifest_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        _fsync_dir(self.manifest_path)
+
+    def _part_path(self, month):
+        return os.path.join(self.path, month + ".csv")
+
+    def _load_part(self, month):
+        """Rows of one month, parsed once per version of its file."""
+        path = self._part_path(month)
+        version = file_version(path)
+        with self._lock:
+            hit = self._parts.get(month)
+            if hit is not None and hit[0] == version:
+                self._parts.move_to_end(month)
+                return hit[1]
+        if version is None:
+            rows = []
+        else:
+            with open(path, "r", newline="") as f:
+                rows = list(csv.reader(f))[1:]
+        with self._lock:
+            self._parts[month] = (version, rows)
+            self._parts.move_to_end(month)
+            while len(self._parts) > PARTITION_CACHE_SIZE:
+                self._parts.popitem(last=False)
+        return rows
+
+    def _months(self, start=None, end=None):
+        months = sorted(self.manifest())
+        if start is not None:
+            months = [m for m in months if _month_of(start) <= m <= _month_of(end)]
+        return months
+
+    @timed("store.read_all")
+    def read_all(self):
+        version = self.version()
+        rows = _cache_get(self.cache_key, version)
+        if rows is None:
+            rows = [r for m in self._months() for r in self._load_part(m)]
+            _cache_put(self.cache_key, version, rows)
+        return list(rows)
+
+    def iter_rows(self):
+        """Yield rows month by month; only one month is held at a time."""
+        for m in self._months():
+            yield from self._load_part(m)
+
+    def tail(self, n):
+        """The ``n`` latest dates, oldest first, from the newest months only."""
+        out = []
+        for m in reversed(self._months()):
+            if len(out) >= n:
+                break
+            out[:0] = self._load_part(m)
+        return out[-n:] if n > 0 else []
+
+    def get(self, day):
+        for r in self._load_part(_month_of(day)):
+            if r and r[0] == day:
+                return r
+        return None
+
+    def range(self, start, end):
+        """Rows with ``start <= date <= end``, reading only the months in between."""
+        return [r for m in self._months(start, end) for r in self._load_part(m)
+                if r and start <= r[0] <= end]
+
+    def _month_counts(self, start, end):
+        """[(month, rows in range)]; whole months are counted from the manifest."""
+        parts = self.manifest()
+        months = sorted(parts)
+        if start is not None:
+            months = [m for m in months if m >= _month_of(start)]
+        if end is not None:
+            months = [m for m in months if m <= _month_of(end)]
+        out = []
+        for m in months:
+            inside = (start is None and end is None) or (
+                m != UNDATED and (start is None or m > _month_of(start))
+                and (end is None or m < _month_of(end)))
+            if inside:
+                out.append((m, parts[m]["rows"]))
+            else:  # a month the range cuts through: count its rows
+                out.append((m, len(self._in_range(m, start, end))))
+        return out
+
+    def _in_range(self, month, start, end):
+        return [r for r in self._load_part(month)
+                if r and (start is None or r[0] >= start) and (end is None or r[0] <= end)]
+
+    def count(self, start=None, end=None):
+        return sum(n for _, n in self._month_counts(start, end))
+
+    def page(self, offset=0, limit=PAGE_SIZE, start=None, end=None, newest_first=False):
+        """One page of the range; months before the page are skipped by their row counts."""
+        months = self._month_counts(start, end)
+        if newest_first:
+            months.reverse()
+        out = []
+        for m, n in months:
+            if len(out) >= limit:
+                break
+            if offset >= n:
+                offset -= n
+                continue
+            rows = self._in_range(m, start, end)
+            if newest_first:
+                rows = rows[::-1]
+            out += rows[offset:offset + limit - len(out)]
+            offset = 0
+        return out
+
+    def dates(self):
+        return [r[0] for r in self.iter_rows() if r]
+
+    def _save_months(self, changes, replace_all=False):
+        """Apply {month: change(rows) -> rows} under the lock, one file per month."""
+        self.ensure_file()
+        with file_lock(self.lock_path):
+            parts = {} if replace_all else dict(self.manifest())
+            for month, change in changes.items():
+                rows = change(list(self._load_part(month)))
+                path = self._part_path(month)
+                if rows:
+                    rows.sort(key=lambda r: r[0])
+                    durable_write_rows(path, rows)
+                    parts[month] = {"rows": len(rows), "first": rows[0][0], "last": rows[-1][0]}
+                else:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    parts.pop(month, None)
+                with self._lock:
+                    # what we just wrote is the month's new contents
+                    self._parts[month] = (file_version(path), rows)
+            if replace_all:
+                for month in set(self.manifest()) - set(parts):
+                    path = self._part_path(month)
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._write_manifest(parts)
+            with self._lock:
+                self._invalidate()
+
+    def _change(self, day, expected, row):
+        def change(rows):
+            current = next((r for r in rows if r and r[0] == day), None)
+            _check_expected(current, expected, day)
+            rows = [r for r in rows if r and r[0] != day]
+            if row is not None:
+                rows.append(row)
+            return rows
+        self._save_months({_month_of(day): change})
+
+    @timed("store.upsert")
+    def upsert(self, row, expected=ANY):
+        row = _text_row(row)
+        self._change(row[0], expected, row)
+
+    def append(self, row):
+        self.upsert(row)
+
+    @timed("store.delete")
+    def delete(self, day, expected=ANY):
+        self._change(day, expected, None)
+
+    @staticmethod
+    def _by_month(rows):
+        months = {}
+        for r in rows:
+            if r:
+                r = _text_row(r)
+                months.setdefault(_month_of(r[0]), {})[r[0]] = r  # later rows win
+        return months
+
+    @timed("store.upsert_many")
+    def upsert_many(self, rows):
+        def merge(new):
+            def change(rows):
+                merged = {r[0]: r for r in rows if r}
+                merged.update(new)
+                return list(merged.values())
+            return change
+        self._save_months({m: merge(new) for m, new in self._by_month(rows).items()})
+
+    @timed("store.write_all")
+    def write_all(self, rows):
+        months = self._by_month(rows)
+        self._save_months({m: (lambda _, new=new: list(new.values())) for m, new in months.items()},
+                          replace_all=True)
+
+
+def partition_dir_for(csv_path):
+    return os.path.splitext(csv_path)[0] + ".parts"
+
+
+def migrate_csv_to_partitions(csv_path=DATA_FILE, root=None):
+    """One-shot split of an existing CSV into monthly partitions.
+
+    Later rows win when a date appears more than once. Returns the number of
+    dates stored.
+    """
+    root = root or partition_dir_for(csv_path)
+    rows = CsvStore(csv_path).read_all() if os.path.exists(csv_path) else []
+    store = PartitionedStore(root)
+    store.write_all(rows)
+    return sum(p["rows"] for p in store.manifest().values())
+
+
+# -----------------------
+# Store lookup
+# -----------------------
+_stores = {}
+
+
+def open_store(path=DATA_FILE, mode=None):
+    """Return the shared store for ``path`` (one instance per file)."""
+    mode = mode or STORAGE_MODE
+    key = (os.path.abspath(path), mode)
+    if key not in _stores:
+        if mode == "log":
+            _stores[key] = LogStore(path)
+        elif mode == "sqlite":
+            db_path = sqlite_path_for(path)
+            if not os.path.exists(db_path) and os.path.exists(path):
+                migrate_csv_to_sqlite(path, db_path)
+            _stores[key] = SqliteStore(db_path)
+        elif mode == "partitioned":
+            root = partition_dir_for(path)
+            if not os.path.exists(root) and os.path.exists(path):
+                migrate_csv_to_partitions(path, root)
+            _stores[key] = PartitionedStore(root)
+        elif mode == "binary":
+            import binstore  # needs NumPy, and imports this module
+            from records import Quarantine
+
+            bin_path = binstore.binary_path_for(path)
+            if not os.path.exists(bin_path) and os.path.exists(path):
+                bad = Quarantine()  # rows the binary format can't hold
+                binstore.migrate_csv_to_binary(path, bin_path, on_bad=bad)
+                bad.report()
+            _stores[key] = binstore.BinaryStore(bin_path)
+        else:
+            _stores[key] = CsvStore(path)
+    return _stores[key]
+
+
+def close_store(path=DATA_FILE, mode=None):
+    """Forget the shared store for ``path`` and drop its cached rows.
+
+    Saves already submitted still finish; the next open_store() starts fresh.
+    The store itself is left open, since a session may still be using it;
+    its connection or mapping goes away with the last reference to it.
+    """
+    mode = mode or STORAGE_MODE
+    store = _stores.pop((os.path.abspath(path), mode), None)
+    if store is None:
+        return
+    invalidate_cache(store.cache_key)
+    if hasattr(store, "index_key"):
+        invalidate_cache(store.index_key)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        src = sys.argv[2] if len(sys.argv) > 2 else DATA_FILE
+        target = sys.argv[3] if len(sys.argv) > 3 else "sqlite"
+        if target == "partitioned":
+            n = migrate_csv_to_partitions(src)
+            print(f"✅ Migrated {n} entries into {partition_dir_for(src)}")
+        elif target == "binary":
+            import binstore
+            from records import Quarantine
+
+            bad = Quarantine()
+            n = binstore.migrate_csv_to_binary(src, on_bad=bad)
+            print(f"✅ Migrated {n} entries into {binstore.binary_path_for(src)}")
+            bad.report()
+        else:
+            n = migrate_csv_to_sqlite(src)
+            print(f"✅ Migrated {n} entries into {sqlite_path_for(src)}")
+    else:
+        print("Usage: python storage.py migrate [tracker_data.csv] [sqlite|partitioned|binary]")
@@ -1,10 +1,16 @@
 import csv
 import os
+import sys
 from datetime import date
-import matplotlib.pyplot as plt
 import json
-import os
 import calendar
+from storage import HEADER, ConflictError, open_store
+from records import Quarantine, format_entry, iter_entries, last_days, page_entries, range_summary, summarize
+import metrics
+from metrics import timed
+
+# Set by load_config() when the menu starts
+config = None
 
 def load_config():
     config_file = 'config.json'
@@ -112,120 +118,71 @@ def get_daily_input():
 
     notes = input('Write anything: ')
 
-    filename = 'tracker_data.csv'
-    file_exists = os.path.isfile(filename)
-
-    # Create file with correct header if it doesn't exist
-    if not file_exists:
-        with open(filename, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['date', 'sleep', 'mood', 'water_intake', 'period', 'notes'])
-
-    with open(filename, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([today, sleep, mood, water_intake, period, notes])
+    open_store().append([today, sleep, mood, water_intake, period, notes])
 
     print('✅ Your entry has been saved!')
 
 
+@timed("cli.view_last_entries")
 def view_last_entries():
-    filename = 'tracker_data.csv'
-    if not os.path.isfile(filename):
+    store = open_store()
+    if not store.count():
         print('No entries found yet. Please add data first.')
         return
 
-    with open(filename, 'r') as file:
-        reader = list(csv.reader(file))
-        header = reader[0]
-        data = reader[1:]
+    last_entries = store.tail(5)
 
-        if not data:
-            print('No data available.')
-            return
+    if not last_entries:
+        print('No data available.')
+        return
 
-        last_entries = data[-5:]
-        print('\nLast 5 entries:')
-        print(', '.join(header))
-        for row in last_entries:
-            print(', '.join(row))
+    print('\nLast 5 entries:')
+    print(', '.join(HEADER))
+    for row in last_entries:
+        print(', '.join(row))
 
 
+@timed("cli.view_weekly_summary")
 def view_weekly_summary():
-    from datetime import datetime
-
-    filename = 'tracker_data.csv'
-    with open(filename, 'r') as file:
-        reader = csv.reader(file)
-        next(reader)
-        rows = [row for row in reader if len(row) >= 6]
-
-    entries = []
-    mood_counts = {'Happy': 0, 'Neutral': 0, 'Low': 0}
-    total_sleep = 0
-    total_water = 0
-    period_count = 0
-    entry_count = 0
-
-    for row in rows:
-        try:
-            entry_date = datetime.strptime(row[0], "%Y-%m-%d").date()
-            sleep = float(row[1])
-            mood = row[2]
-            water = float(row[3])
-            period = row[4].strip().lower()
-            entries.append((entry_date, sleep, water))
-            total_sleep += sleep
-            total_water += water
-            mood_counts[mood] += 1
-            entry_count += 1
-            if period == 'yes':
-                period_count += 1
-        except:
-            continue
+    bad = Quarantine()
+    summary = range_summary(*last_days(7), on_bad=bad)
+    bad.report()
 
-    if entry_count == 0:
-        print("No valid data found.")
+    if summary['avg_sleep'] is None and summary['avg_water'] is None:
+        print("No valid data found for the last 7 days.")
         return
 
-    print(f'\nAverage Sleep: {total_sleep / entry_count:.1f} hrs')
-    print(f'Average Water Intake: {total_water / entry_count:.1f} L')
-    print(f'Mood Counts: {mood_counts}')
-    print(f'Period days this week: {period_count}')
-
-    # --- Streak Logic Begins ---
-    def calculate_streaks(values, condition):
-        current_streak = 0
-        longest_streak = 0
-        temp_streak = 0
-        for val in values:
-            if condition(val):
-                temp_streak += 1
-                longest_streak = max(longest_streak, temp_streak)
-            else:
-                temp_streak = 0
-        current_streak = temp_streak
-        return current_streak, longest_streak
-
-    # Extract sequences
-    sleep_values = [sleep for (_, sleep, _) in entries]
-    water_values = [water for (_, _, water) in entries]
-
-    # Streaks
-    sleep_current, sleep_longest = calculate_streaks(sleep_values, lambda x: x >= config['sleep_goal'])
-    water_current, water_longest = calculate_streaks(water_values, lambda x: x >= config['water_goal'])
+    print(f"\nLast 7 days ({summary['start']} to {summary['end']}), {summary['entries']} entries")
+    print(f"Average Sleep: {summary['avg_sleep'] or 0:.1f} hrs")
+    print(f"Average Water Intake: {summary['avg_water'] or 0:.1f} L")
+    print(f"Mood Counts: {summary['mood_counts']}")
+    print(f"Period days this week: {summary['period_days']}")
 
+    import analytics
+    cols = analytics.columns_for(open_store())
+    sleep_current, sleep_longest = analytics.goal_streaks(cols.sleep, config['sleep_goal'])
+    water_current, water_longest = analytics.goal_streaks(cols.water, config['water_goal'])
     print(f"\n🎯 Sleep streak: {sleep_current} day(s) with ≥{config['sleep_goal']} hrs sleep (Longest: {sleep_longest})")
     print(f"💧 Water streak: {water_current} day(s) with ≥{config['water_goal']}L water (Longest: {water_longest})")
 
 
-def view_all_entries():
-    with open('tracker_data.csv', 'r') as file:
-        reader = csv.reader(file)
-        next(reader)
-
-        print('\nAll Tracked Entries:')
-        for row in reader:
-            print(', '.join(row))
+@timed("cli.view_all_entries")
+def view_all_entries(limit=20):
+    # one page at a time, so a long history is never loaded all at once
+    bad = Quarantine()
+    print('\nAll Tracked Entries:')
+    page = 1
+    while True:
+        entries, total = page_entries(page, limit, on_bad=bad)
+        for entry in entries:
+            print(format_entry(entry))
+        if page * limit >= total:
+            break
+        more = input(f"-- {page * limit} of {total} shown. Enter for more, q to stop: ").strip().lower()
+        if more == 'q':
+            break
+        page += 1
+    bad.report()
 
 
 def reset_tracker():
@@ -237,38 +194,19 @@ def reset_tracker():
             print("! Please enter 'yes' or 'no'.")
 
     if confirm == 'yes':
-        with open('tracker_data.csv', 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['date', 'sleep', 'mood', 'water_intake', 'period', 'notes'])  # fixed header
+        open_store().write_all([])  # header is kept
         print("🗑️ Tracker has been reset successfully.")
     else:
         print("❎ Reset cancelled.")
 
 
+@timed("cli.export_weekly_summary")
 def export_weekly_summary():
-    with open('tracker_data.csv', 'r') as file:
-        reader = csv.reader(file)
-        next(reader)
-
-        total_sleep = 0
-        total_water = 0
-        mood_counts = {'Happy': 0, 'Neutral': 0, 'Low': 0}
-        entry_count = 0
-
-        for row in reader:
-            if len(row) < 6:
-                continue
-
-            sleep = float(row[1])
-            mood = row[2]
-            water = float(row[3])
+    bad = Quarantine()
+    summary = range_summary(*last_days(7), on_bad=bad)
+    bad.report()
 
-            total_sleep += sleep
-            total_water += water
-            entry_count += 1
-            mood_counts[mood] += 1
-
-    if entry_count == 0:
+    if summary['avg_sleep'] is None and summary['avg_water'] is None:
         print("No data to export.")
         return
 
@@ -280,9 +218,10 @@ def export_weekly_summary():
         if not file_exists:
             writer.writerow(['avg_sleep', 'avg_water', 'happy_count', 'neutral_count', 'low_count'])
 
+        mood_counts = summary['mood_counts']
         writer.writerow([
-            total_sleep / entry_count,
-            total_water / entry_count,
+            summary['avg_sleep'] or 0,
+            summary['avg_water'] or 0,
             mood_counts['Happy'],
             mood_counts['Neutral'],
             mood_counts['Low']
@@ -291,18 +230,18 @@ def export_weekly_summary():
     print("📁 Your weekly summary has been exported successfully!")
 
 
+@timed("cli.view_period_days")
 def view_period_days():
-    with open('tracker_data.csv', 'r') as file:
-        reader = csv.reader(file)
-        next(reader)
-
-        period_dates = [row[0] for row in reader if len(row) >= 6 and row[4].strip().lower() == 'yes']
-
     print("\n🩸 Period days tracked:")
-    if not period_dates:
+    bad = Quarantine()
+    found = False
+    for entry in iter_entries(on_bad=bad):
+        if entry.period:
+            found = True
+            print(f"- {entry.date.isoformat()}")
+    if not found:
         print("No period days recorded.")
-    for date in period_dates:
-        print(f"- {date}")
+    bad.report()
 
 def show_help():
     print("\n===== Help Menu =====")
@@ -321,59 +260,31 @@ def show_help():
 
 
 
+@timed("cli.plot_weekly_trends")
 def plot_weekly_trends():
-    with open('tracker_data.csv', 'r') as file:
-        reader = csv.reader(file)
-        next(reader)
-
-        mood_counts = {'Happy': 0, 'Neutral': 0, 'Low': 0}
-        total_sleep = 0
-        total_water = 0
-        entry_count = 0
-
-        for row in reader:
-            if len(row) < 6:
-                continue
-            sleep = float(row[1])
-            mood = row[2]
-            water = float(row[3])
+    import matplotlib.pyplot as plt
+    import charts
 
-            total_sleep += sleep
-            total_water += water
-            mood_counts[mood] += 1
-            entry_count += 1
+    bad = Quarantine()
+    summary = summarize(iter_entries(on_bad=bad))
+    bad.report()
 
-    if entry_count == 0:
+    if summary['avg_sleep'] is None and summary['avg_water'] is None:
         print("No data to plot.")
         return
 
-    avg_sleep = total_sleep / entry_count
-    avg_water = total_water / entry_count
-
-    fig, axs = plt.subplots(1, 2, figsize=(12, 5))
-
-    axs[0].bar(mood_counts.keys(), mood_counts.values(), color='plum')
-    axs[0].set_title('Mood Trends')
-    axs[0].set_ylabel('Count')
-
-    axs[1].bar(['Avg Sleep', 'Avg Water'], [avg_sleep, avg_water], color=['skyblue', 'lightgreen'])
-    axs[1].set_title('Weekly Averages')
-    axs[1].set_ylabel('Values')
-
-    plt.tight_layout()
+    charts.draw_weekly(plt.figure(figsize=(12, 5)), summary)
     plt.show()
 
 
 def manage_entries():
-    filename = 'tracker_data.csv'
-    if not os.path.isfile(filename):
-        print("⚠️ No data file found.")
+    store = open_store()
+    if not store.count():
+        print("⚠️ No entries found yet.")
         return
 
-    with open(filename, 'r') as file:
-        reader = list(csv.reader(file))
-        header = reader[0]
-        raw_rows = reader[1:]
+    header = HEADER
+    raw_rows = store.read_all()
 
     # Filter out bad/empty rows
     rows = [row for row in raw_rows if len(row) == len(header)]
@@ -410,12 +321,24 @@ def manage_entries():
         for i, field in enumerate(header):
             value = input(f"{field} [{selected[i]}]: ").strip()
             new_row.append(value if value else selected[i])
-        rows[index] = new_row
+        try:
+            if new_row[0] != selected[0]:
+                open_store().delete(selected[0], expected=selected)
+                open_store().upsert(new_row)
+            else:
+                open_store().upsert(new_row, expected=selected)
+        except ConflictError:
+            print("⚠️ This entry was changed elsewhere while you were editing. Nothing was saved.")
+            return
         print("✅ Entry updated.")
     elif action == 'd':
         confirm = input("Are you sure you want to delete this entry? (yes/no): ").strip().lower()
         if confirm == 'yes':
-            del rows[index]
+            try:
+                open_store().delete(selected[0], expected=selected)
+            except ConflictError:
+                print("⚠️ This entry was changed elsewhere. Nothing was deleted.")
+                return
             print("🗑️ Entry deleted.")
         else:
             print("❎ Deletion cancelled.")
@@ -424,13 +347,9 @@ def manage_entries():
         print("❎ Cancelled.")
         return
 
-    # Save cleaned + updated data
-    with open(filename, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(header)
-        writer.writerows(rows)
     print("💾 Changes saved to file.")
 
+@timed("cli.show_period_calendar_interactive")
 def show_period_calendar_interactive():
     import calendar
     from datetime import datetime, date
@@ -440,15 +359,11 @@ def show_period_calendar_interactive():
     year = today.year
     month = today.month
 
-    # Step 1: Load existing entries
-    rows = []
-    if os.path.isfile(filename):
-        with open(filename, 'r') as file:
-            reader = list(csv.reader(file))
-            header = reader[0]
-            rows = reader[1:]
-    else:
-        header = ['date', 'sleep', 'mood', 'water_intake', 'period', 'notes']
+    # Step 1: Load this month's entries only
+    store = open_store(filename)
+    first = date(year, month, 1).isoformat()
+    last = date(year, month, calendar.monthrange(year, month)[1]).isoformat()
+    rows = store.range(first, last)
 
     # Step 2: Build a dict of entries
     entries = {row[0]: row for row in rows if len(row) >= 6}
@@ -494,8 +409,9 @@ def show_period_calendar_interactive():
         return
 
     # Step 5: Check if entry exists
+    original = entries.get(selected_date)
     if selected_date in entries:
-        row = entries[selected_date]
+        row = list(entries[selected_date])
         print(f"\nCurrent period status for {selected_date}: {row[4]}")
         new_status = input("Set period status to (yes/no): ").strip().lower()
         if new_status in ['yes', 'no']:
@@ -519,87 +435,39 @@ def show_period_calendar_interactive():
         entries[selected_date] = new_row
         print("✅ New entry created and period marked.")
 
-    # Step 6: Write back to CSV
-    all_rows = list(entries.values())
-    all_rows.sort()  # by date
-
-    with open(filename, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(header)
-        writer.writerows(all_rows)
+    # Step 6: Save just the changed day, unless someone else already has
+    try:
+        store.upsert(entries[selected_date], expected=original)
+    except ConflictError:
+        print("⚠️ This day was changed elsewhere in the meantime. Nothing was saved.")
+        return
 
     print("💾 Changes saved successfully!")
 
 
 
 
+@timed("cli.plot_streak_chart")
 def plot_streak_chart():
     import matplotlib.pyplot as plt
-    from datetime import datetime
+    import analytics
+    import charts
 
-    filename = 'tracker_data.csv'
-    if not os.path.isfile(filename):
+    store = open_store()
+    if not store.count():
         print("No data found.")
         return
 
-    with open(filename, 'r') as file:
-        reader = csv.reader(file)
-        next(reader)
-        rows = [row for row in reader if len(row) >= 6]
+    cols = analytics.columns_for(store)
+    days, status = analytics.goal_status(cols, config['sleep_goal'], config['water_goal'])
 
-    entries = []
-    for row in rows:
-        try:
-            entry_date = datetime.strptime(row[0], "%Y-%m-%d").date()
-            sleep = float(row[1])
-            water = float(row[3])
-            entries.append((entry_date, sleep, water))
-        except:
-            continue
-
-    if not entries:
+    if not len(days):
         print("No valid entries to display.")
         return
 
-    entries.sort()  # oldest to newest
-
-    dates = []
-    status = []  # 0 = missed both, 1 = met one, 2 = met both
-
-    for entry_date, sleep, water in entries:
-        goal_hit = 0
-    if sleep >= config['sleep_goal']:
-        goal_hit += 1
-    if water >= config['water_goal']:
-        goal_hit += 1
-
-
-        dates.append(entry_date.strftime("%b %d"))
-        status.append(goal_hit)
-
-    # Plotting
-    colors = {0: 'lightcoral', 1: 'gold', 2: 'lightgreen'}
-    bar_colors = [colors[val] for val in status]
-
-    plt.figure(figsize=(12, 5))
-    plt.bar(dates, status, color=bar_colors, edgecolor='black')
-    plt.xticks(rotation=45)
-    plt.ylim(0, 2.5)
-    plt.yticks([0, 1, 2], ['Missed Both', 'One Goal', 'Both Goals'])
-    plt.title(f'📊 Daily Goal Streaks (Sleep ≥ {config["sleep_goal"]}h, Water ≥ {config["water_goal"]}L)')
-    plt.xlabel('Date')
-    plt.ylabel('Goals Met')
-    plt.tight_layout()
-    plt.grid(axis='y', linestyle='--', alpha=0.5)
+    charts.draw_streaks(plt.figure(figsize=(12, 5)), days, status, config)
     plt.show()
 
-# Load goals from config file
-config = load_config()
-
-# Start the tracker app
-
-
-
 def main_menu():
     while True:
         print("\n1. Add daily entry")
@@ -638,6 +506,7 @@ def main_menu():
             view_period_days()
         elif choice == '9':
             print("👋 Exiting the tracker. Stay healthy!")
+            break
         elif choice == '10':
             plot_streak_chart()
         elif choice == '11':
@@ -652,5 +521,12 @@ def main_menu():
             print("❌ Invalid input. Please try again.")
 
 
-# Start the app
-main_menu()
+if __name__ == '__main__':
+    metrics.dump_at_exit()
+    if len(sys.argv) > 1:
+        # scripted use: python tracker.py <command> ... (see cli.py)
+        import cli
+        sys.exit(cli.main())
+    # Load goals from config file, then start the interactive menu
+    config = load_config()
+    main_menu()
@@ -0,0 +1,169 @@
+# users.py
+"""Per-user data shards for deployments that serve many people.
+
+Each user gets their own directory holding an entry store, a profile and a
+config:
+
+    users/3f/alice/tracker_data.csv
+    users/3f/alice/profile.json
+    users/3f/alice/config.json
+
+The two-character bucket (from a hash of the user ID) keeps any one
+directory small with thousands of users. Nothing is read until a user's
+shard is opened, and at most ``MAX_OPEN_SHARDS`` stay open at once.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import storage
+
+DATA_DIR = os.environ.get("TRACKER_DATA_DIR", "users")
+MAX_OPEN_SHARDS = int(os.environ.get("TRACKER_OPEN_SHARDS", "64"))
+DEFAULT_CONFIG = {"sleep_goal": 7.0, "water_goal": 2.0}
+
+_USER_ID = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}$")
+
+
+def shard_dir(user_id, root=None):
+    """Directory for ``user_id``; raises ValueError for IDs unsafe in a path."""
+    if not isinstance(user_id, str) or not _USER_ID.match(user_id):
+        raise ValueError(f"Invalid user ID: {user_id!r}")
+    bucket = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:2]
+    return os.path.join(root or DATA_DIR, bucket, user_id)
+
+
+class UserShard:
+    """One user's files. The entry store is opened on first use."""
+
+    def __init__(self, user_id, root=None, mode=None):
+        self.user_id = user_id
+        self.dir = shard_dir(user_id, root)
+        self.mode = mode
+        self.data_path = os.path.join(self.dir, storage.DATA_FILE)
+        self.profile_path = os.path.join(self.dir, "profile.json")
+        self.config_path = os.path.join(self.dir, "config.json")
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            os.makedirs(self.dir, exist_ok=True)
+            self._store = storage.open_store(self.data_path, self.mode)
+        return self._store
+
+    def load_profile(self):
+        try:
+            with open(self.profile_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_profile(self, profile):
+        os.makedirs(self.dir, exist_ok=True)
+        with open(self.profile_path, "w") as f:
+            json.dump(profile, f, indent=4)
+
+    def load_config(self):
+        try:
+            with open(self.config_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict(DEFAULT_CONFIG)
+
+    def save_config(self, cfg):
+        os.makedirs(self.dir, exist_ok=True)
+        with open(self.config_path, "w") as f:
+            json.dump(cfg, f, indent=4)
+
+    def close(self):
+        """Forget the store and everything cached from it.
+
+        Runs still holding the store can keep using it; it is released once
+        the last of them drops it.
+        """
+        if self._store is None:
+            return
+        # imported here so opening a shard from cli.py doesn't load NumPy
+        import aggregates
+        import analytics
+        import cycles
+        import frames
+        import period
+        import rolling
+
+        store, self._store = self._store, None
+        aggregates.forget(store)
+        analytics.forget(store)
+        cycles.forget(store)
+        frames.forget(store)
+        period.forget_month(store)
+        rolling.forget(store)
+        storage.close_store(self.data_path, self.mode)
+
+
+class ShardRegistry:
+    """Opens user shards lazily and keeps the ``max_open`` most recent."""
+
+    def __init__(self, root=None, max_open=MAX_OPEN_SHARDS, mode=None):
+        self.root = root or DATA_DIR
+        self.max_open = max_open
+        self.mode = mode
+        self._open = OrderedDict()  # user ID -> UserShard, oldest first
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            shard = self._open.get(user_id)
+            if shard is not None:
+                self._open.move_to_end(user_id)
+                return shard
+            shard = self._open[user_id] = UserShard(user_id, self.root, self.mode)
+            evicted = []
+            while len(self._open) > self.max_open:
+                evicted.append(self._open.popitem(last=False)[1])
+        for old in evicted:
+            old.close()
+        return shard
+
+    def close(self, user_id=None):
+        """Close one user's shard, or all of them."""
+        with self._lock:
+            if user_id is None:
+                shards = list(self._open.values())
+                self._open.clear()
+            else:
+                shard = self._open.pop(user_id, None)
+                shards = [shard] if shard else []
+        for shard in shards:
+            shard.close()
+
+    def __len__(self):
+        return len(self._open)
+
+    def users(self):
+        """Yield every user ID that has a shard on disk, without opening any."""
+        if not os.path.isdir(self.root):
+            return
+        for bucket in sorted(os.listdir(self.root)):
+            bucket_dir = os.path.join(self.root, bucket)
+            if os.path.isdir(bucket_dir):
+                for user_id in sorted(os.listdir(bucket_dir)):
+                    if _USER_ID.match(user_id):
+                        yield user_id
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def registry():
+    """The process-wide ShardRegistry (one per DATA_DIR)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ShardRegistry()
+        return _registry